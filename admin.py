@@ -1,52 +1,287 @@
-# This script is attached in this project to initially help with creation of
-# admin account because on the web it is not safe to create such an account
-# with super powers
+# Admin command line tool.
+# Creating the first admin is done here rather than on the web, because it is not
+# safe to create an account with super powers through a public page. The other
+# commands move users and serviceRequests in and out of the database as NDJSON, one
+# {"key": ..., "value": {...}} object per line. Both directions stream in batches, so
+# memory use stays flat however many records there are.
+#
+#   python admin.py create-admin
+#   python admin.py export users -o users.ndjson
+#   python admin.py export serviceRequests -o bookings.ndjson
+#   python admin.py import users users.ndjson --checkpoint users.ckpt
+#   python admin.py import serviceRequests bookings.ndjson --checkpoint bookings.ckpt
+#   python admin.py reindex
+#   python admin.py stats check|rebuild
+#   python admin.py emails check|rebuild
+#   python admin.py delete-user someone@example.com
+#   python admin.py archive [--closed-days 30] [--max-age-days 365] [--dry-run]
+#
+# Imported users that carry a "password" get a login account created with the same
+# uid (concurrently, --workers at a time); the others are assumed to have their
+# account already, e.g. moved with `firebase auth:import`. An interrupted import
+# restarts after the last written batch when run again with the same --checkpoint.
 
-import firebase_admin
-from firebase_admin import credentials, auth, db
+import argparse
+import json
 import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
 from dotenv import load_dotenv
 
 # Load .env variables
 load_dotenv()
 
-SERVICE_ACCOUNT_PATH = os.getenv("SERVICE_ACCOUNT_PATH")
-FIREBASE_DB_URL = os.getenv("FIREBASE_DB_URL")
-
-# Initialize Firebase if not already initialized
-if not firebase_admin._apps:
-    cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
-    firebase_admin.initialize_app(cred, {
-        "databaseURL": FIREBASE_DB_URL
-    })
-
-
-# Admin user details
-print("You are about to create a new administrator into Service Request Database !!!!\n")
-admin_email = str(input("Provide new admin email address : ")) 
-admin_password = str(input("Provide new admin password : "))      
-admin_name = str(input("Provide new admin name : "))
-admin_surname = str(input("Provide new admin surname : "))
-admin_phone = int(input("Provide new admin phone number : "))
-
-try:
-    # Create Firebase Auth user
-    user_record = auth.create_user(
-        email=admin_email,
-        password=admin_password
-    )
-    uid = user_record.uid
-    print(f"Admin user created with UID: {uid}")
-
-    # Add to Realtime Database
-    db.reference(f"users/{uid}").set({
-        "name": admin_name,
-        "surname": admin_surname,
-        "email": admin_email,
-        "phone": admin_phone,
-        "role": "admin"
-    })
-    print("Admin added to Firebase Realtime Database successfully!")
-
-except Exception as e:
-    print("Error creating admin:", e)
+from storage import get_store, push_key, increment, scan, AccountExists, AccountNotFound
+from users import save_user_profile, mechanic_entry, email_key, reconcile_email_index, find_uid, delete_user
+from bookings import INDEX_FIELDS, index_fields, get_bookings
+import stats
+
+COLLECTIONS = ("users", "serviceRequests")
+
+
+def create_admin():
+    store = get_store()
+
+    # Admin user details
+    print("You are about to create a new administrator into Service Request Database !!!!\n")
+    admin_email = str(input("Provide new admin email address : "))
+    admin_password = str(input("Provide new admin password : "))
+    admin_name = str(input("Provide new admin name : "))
+    admin_surname = str(input("Provide new admin surname : "))
+    admin_phone = int(input("Provide new admin phone number : "))
+
+    try:
+        # Create the login account (Firebase Auth)
+        uid = store.create_account(admin_email, admin_password)
+        print(f"Admin user created with UID: {uid}")
+
+        # Add to the database
+        save_user_profile(uid, {
+            "name": admin_name,
+            "surname": admin_surname,
+            "email": admin_email,
+            "phone": admin_phone,
+            "role": "admin"
+        })
+        print("Admin added to the database successfully!")
+
+    except Exception as e:
+        print("Error creating admin:", e)
+
+
+class Progress:
+    def __init__(self, verb):
+        self.verb = verb
+        self.count = 0
+        self.started = time.monotonic()
+
+    def add(self, n):
+        self.count += n
+        elapsed = time.monotonic() - self.started
+        rate = self.count / elapsed if elapsed else 0
+        # Progress goes to stderr so an export can be piped from stdout
+        print(f"{self.verb} {self.count} records ({rate:.0f}/s)", file=sys.stderr)
+
+
+def export_records(collection, out, batch_size):
+    """Write every record of a collection to out, one key-ordered batch at a time."""
+    progress = Progress("Exported")
+    for batch in scan(collection, batch_size):
+        for key, value in batch.items():
+            if collection == "serviceRequests":
+                # Index fields are derived, the import recomputes them
+                value = {field: v for field, v in value.items() if field not in INDEX_FIELDS}
+            out.write(json.dumps({"key": key, "value": value}) + "\n")
+        progress.add(len(batch))
+    return progress.count
+
+
+def read_checkpoint(path, source):
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path, encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("source") != os.path.abspath(source):
+        sys.exit(f"Checkpoint {path} belongs to {checkpoint.get('source')}, not {source}")
+    return checkpoint["line"]
+
+
+def write_checkpoint(path, source, line):
+    if not path:
+        return
+    # Write then rename, so a crash never leaves a half-written checkpoint
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"source": os.path.abspath(source), "line": line}, f)
+    os.replace(path + ".tmp", path)
+
+
+def read_batches(source, skip, batch_size):
+    """Yield (last line number, records) from an NDJSON file, after the first `skip` lines."""
+    batch = []
+    with open(source, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if line_no <= skip or not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record.get("value"), dict):
+                    raise ValueError("missing \"value\" object")
+            except (ValueError, AttributeError) as e:
+                sys.exit(f"{source}:{line_no}: invalid record ({e})")
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield line_no, batch
+                batch = []
+        if batch:
+            yield line_no, batch
+
+
+def _account_for(record):
+    # Login account for an imported user; keeps the exported uid when it is free
+    uid = record.get("key")
+    password = record.get("password")
+    if not password:
+        return uid
+    email = record["value"].get("email")
+    try:
+        return get_store().create_account(email, password, uid=uid)
+    except AccountExists:
+        # The email has an account already, or the uid is held by another email
+        try:
+            return get_store().find_account(email)
+        except AccountNotFound:
+            print(f"Skipping {email}: uid {uid} belongs to another account", file=sys.stderr)
+            return None
+
+
+def import_users(records, pool):
+    uids = list(pool.map(_account_for, records))
+    updates = {}
+    for uid, record in zip(uids, records):
+        if not uid:
+            if not record.get("key"):
+                print(f"Skipping user without key or password: {record['value'].get('email')}", file=sys.stderr)
+            continue
+        if record.get("key") and uid != record["key"]:
+            print(f"{record['value'].get('email')} already has account {uid}, "
+                  f"references to {record['key']} will not match", file=sys.stderr)
+        profile = record["value"]
+        updates[f"users/{uid}"] = profile
+        if profile.get("role") == "mechanic":
+            updates[f"mechanics/{uid}"] = mechanic_entry(profile)
+        if email_key(profile.get("email")):
+            updates[f"emailIndex/{email_key(profile['email'])}"] = uid
+    get_store().update("", updates)
+
+
+def import_bookings(records, pool):
+    records = [(record.get("key") or push_key(), record["value"]) for record in records]
+    # Existing copies are read so re-importing a booking does not count it twice
+    existing = get_bookings([key for key, _ in records])
+    updates = {}
+    counters = Counter()
+    for key, booking in records:
+        booking = dict(booking, **index_fields(key, booking))
+        updates[f"serviceRequests/{key}"] = booking
+        if booking.get("reference_number"):
+            updates[f"referenceIndex/{booking['reference_number']}"] = key
+        counters.update(stats.changes(existing.get(key), booking))
+    updates.update({path: increment(amount) for path, amount in counters.items() if amount})
+    get_store().update("", updates)
+
+
+def import_records(collection, source, batch_size, checkpoint, workers):
+    """Write an NDJSON file into a collection in multi-path batches. Returns the count."""
+    write_batch = import_users if collection == "users" else import_bookings
+    skip = read_checkpoint(checkpoint, source)
+    if skip:
+        print(f"Resuming {source} after line {skip}", file=sys.stderr)
+    progress = Progress("Imported")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for line_no, records in read_batches(source, skip, batch_size):
+            write_batch(records, pool)
+            write_checkpoint(checkpoint, source, line_no)
+            progress.add(len(records))
+    return progress.count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Service request admin tool")
+    commands = parser.add_subparsers(dest="command")
+
+    commands.add_parser("create-admin", help="create an administrator account interactively")
+
+    export = commands.add_parser("export", help="stream a collection to NDJSON")
+    export.add_argument("collection", choices=COLLECTIONS)
+    export.add_argument("-o", "--output", help="file to write (default: stdout)")
+    export.add_argument("--batch", type=int, default=1000)
+
+    load = commands.add_parser("import", help="load an NDJSON file into a collection")
+    load.add_argument("collection", choices=COLLECTIONS)
+    load.add_argument("file")
+    load.add_argument("--batch", type=int, default=500, help="records per multi-path write")
+    load.add_argument("--checkpoint", help="remember progress here and resume from it")
+    load.add_argument("--workers", type=int, default=8, help="concurrent account creations")
+
+    commands.add_parser("reindex", help="add index fields to older bookings")
+
+    counters = commands.add_parser("stats", help="check or rebuild the booking counters")
+    counters.add_argument("action", choices=("check", "rebuild"))
+
+    emails = commands.add_parser("emails", help="check or rebuild the email index from the login accounts")
+    emails.add_argument("action", choices=("check", "rebuild"))
+
+    remove = commands.add_parser("delete-user", help="delete a login account with its profile and index entries")
+    remove.add_argument("email")
+
+    archive = commands.add_parser("archive", help="move finished bookings to the archive")
+    archive.add_argument("--closed-days", type=int, default=30)
+    archive.add_argument("--max-age-days", type=int, default=365)
+    archive.add_argument("--batch", type=int, default=500)
+    archive.add_argument("--dry-run", action="store_true")
+
+    args = parser.parse_args(argv)
+
+    if args.command in (None, "create-admin"):
+        create_admin()
+    elif args.command == "export":
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as out:
+                total = export_records(args.collection, out, args.batch)
+        else:
+            total = export_records(args.collection, sys.stdout, args.batch)
+        print(f"{total} {args.collection} record(s) exported", file=sys.stderr)
+    elif args.command == "import":
+        total = import_records(args.collection, args.file, args.batch, args.checkpoint, args.workers)
+        print(f"{total} {args.collection} record(s) imported", file=sys.stderr)
+    elif args.command == "reindex":
+        from bookings import reindex_bookings
+        reindex_bookings()
+    elif args.command == "stats":
+        drift = stats.reconcile(write=args.action == "rebuild")
+        for path, (stored, expected) in sorted(drift.items()):
+            print(f"{path}: stored {stored}, counted {expected}")
+        print(f"{len(drift)} counter(s) {'fixed' if args.action == 'rebuild' else 'out of step'}")
+    elif args.command == "emails":
+        drift = reconcile_email_index(write=args.action == "rebuild")
+        for key, (stored, expected) in sorted(drift.items()):
+            print(f"{key}: indexed {stored}, account {expected}")
+        print(f"{len(drift)} email(s) {'fixed' if args.action == 'rebuild' else 'out of step'}")
+    elif args.command == "delete-user":
+        try:
+            uid = find_uid(args.email)
+        except AccountNotFound:
+            sys.exit(f"No account for {args.email}")
+        delete_user(uid)
+        print(f"Deleted user {uid}")
+    elif args.command == "archive":
+        from archive import archive_bookings
+        total = archive_bookings(args.closed_days, args.max_age_days, args.batch, args.dry_run)
+        print(f"{total} booking(s) {'would be ' if args.dry_run else ''}archived")
+
+
+if __name__ == "__main__":
+    main()
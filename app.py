@@ -1,18 +1,34 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, Blueprint, render_template, stream_template, request, redirect, url_for, flash
+from flask import get_flashed_messages
+from markupsafe import Markup
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-import firebase_admin
-from firebase_admin import credentials, auth, db
 import os
 import re
 from dotenv import load_dotenv
-import secrets
-from datetime import datetime
-import smtplib
-from email.mime.text import MIMEText
-from flask import jsonify
+from datetime import datetime, date
+import atexit
+import threading
+from flask import jsonify, make_response
 import traceback
+from functools import partial
 from flask import render_template
 from flask import send_from_directory
+from flask import Response, stream_with_context
+from notifications import Notifier, SMTPTransport, Digest
+from storage import get_store, wrap_store, AccountExists
+import metrics
+import assets
+from bookings import (create_booking, get_booking, get_bookings, update_booking, update_bookings, bookings_by_client,
+                      bookings_by_mechanic, page_bookings, OPEN_STATUSES, CLOSED_STATUSES)
+import stats
+from archive import archived_bookings_for_client
+from events import feed, booking_filter
+from geo import nearest_mechanics, parse_coordinates, update_mechanic_location
+from scheduling import schedule, Calendar, job_interval
+from users import get_user_profile, save_user_profile, get_mechanics, get_mechanic_profiles, find_uid, indexed_uid, refresh_uid
+from fanout import gather
+from tracking import track as track_reference, TRACK_CACHE_TTL
+from routing import mechanic_route
 
 # Loading environmental variables
 load_dotenv()
@@ -21,27 +37,36 @@ FLASK_SECRET_KEY = os.getenv("FLASK_SECRET_KEY", "supersecretkey")
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 EMAIL_USER = os.getenv("EMAIL_USER")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
-FIREBASE_DB_URL = os.getenv("FIREBASE_DB_URL")
-SERVICE_ACCOUNT_PATH = os.getenv("SERVICE_ACCOUNT_PATH")
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "50"))
+NEAREST_MECHANICS = int(os.getenv("NEAREST_MECHANICS", "3"))
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "2"))
+EMAIL_MAX_RETRIES = int(os.getenv("EMAIL_MAX_RETRIES", "3"))
+EMAIL_DEAD_LETTER_PATH = os.getenv("EMAIL_DEAD_LETTER_PATH", "email_dead_letter.ndjson")
+
+# New-request emails to admins are collected into a digest sent every
+# ADMIN_DIGEST_MINUTES or after ADMIN_DIGEST_MAX requests (0 minutes: one email per
+# request). Bookings in an admin's urgent_categories are always sent at once.
+ADMIN_DIGEST_MINUTES = float(os.getenv("ADMIN_DIGEST_MINUTES", "0"))
+ADMIN_DIGEST_MAX = int(os.getenv("ADMIN_DIGEST_MAX", "20"))
 
 ADMINS = [
-    {"email": os.getenv("ADMIN_EMAIL"), "phone": os.getenv("ADMIN_PHONE")}
+    {"email": os.getenv("ADMIN_EMAIL"), "phone": os.getenv("ADMIN_PHONE"),
+     "urgent_categories": [c.strip() for c in os.getenv("ADMIN_URGENT_CATEGORIES", "").split(",") if c.strip()]}
 ]
 
-# Flask setup
-app = Flask(__name__)
-app.secret_key = FLASK_SECRET_KEY
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
-# Initializing Firebase
-if not firebase_admin._apps:
-    cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
-    firebase_admin.initialize_app(cred, {"databaseURL": FIREBASE_DB_URL})
-    print("Firebase initialized")
+# Routes live on a blueprint; create_app() at the bottom builds the Flask app.
+# Nothing here connects to Firebase or the mail server: the store is opened on first
+# use in each process, and so is the email notifier.
+main = Blueprint("main", __name__)
 
 # Flask Login manager
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = "login"
+login_manager.login_view = "main.login"
 
 # User class for storing users
 class User(UserMixin):
@@ -57,7 +82,7 @@ class User(UserMixin):
 @login_manager.user_loader
 def load_user(user_id):
     try:
-        user_data = db.reference(f"users/{user_id}").get()
+        user_data = get_user_profile(user_id)
         if user_data:
             return User(
                 uid=user_id,
@@ -84,28 +109,77 @@ HASHES = {
     "admin_dashboard": "/a7d3c9e5",         
     "new_mechanic": "/n2f6b4c1",            
     "assign_mechanic": "/as9d8e2f",         
+    "nearest_mechanics": "/nm7c2e9b",
+    "mechanic_location": "/ml3a6f2c",
+    "free_slots": "/fs5e1b7d",
+    "bulk_assign": "/ba6d2f8c",
+    "events": "/ev2c8a4f",
+    "analytics": "/an4e8c1b",
+    "stats_api": "/st9a3d6e",
+    "complete_job": "/cj8b5f3a",
+    "route_plan": "/rp4c7e1d",
+    "admin_data": "/ad5b9e2c",
 }
 
 
 # routes
-@app.route("/")
+@main.route("/")
 def index():
     return render_template("home.html")
 
+# Email notifications are queued and sent in the background over pooled SMTP sessions.
+# Each process builds its own notifier on first use, so forked workers never share the
+# parent's sender threads or SMTP connections.
+_notifier = None
+_notifier_lock = threading.Lock()
+
+
+def get_notifier():
+    global _notifier
+    with _notifier_lock:
+        if _notifier is None:
+            _notifier = Notifier(
+                SMTPTransport(SMTP_HOST, SMTP_PORT, EMAIL_USER, EMAIL_PASSWORD, starttls=SMTP_STARTTLS),
+                sender=EMAIL_USER,
+                workers=EMAIL_WORKERS,
+                max_retries=EMAIL_MAX_RETRIES,
+                dead_letter_path=EMAIL_DEAD_LETTER_PATH,
+                on_send=lambda seconds, ok: metrics.record_call("smtp", "send", seconds, ok),
+            )
+            atexit.register(_notifier.stop)
+    return _notifier
+
+
+_admin_digest = None
+
+
+def get_admin_digest():
+    global _admin_digest
+    notifier = get_notifier()
+    with _notifier_lock:
+        if _admin_digest is None:
+            _admin_digest = Digest(notifier, "{count} New Service Request(s)",
+                                   interval=ADMIN_DIGEST_MINUTES * 60, max_items=ADMIN_DIGEST_MAX)
+            # Registered after the notifier's stop, so it runs first and its last digest still goes out
+            atexit.register(_admin_digest.stop)
+    return _admin_digest
+
+
+def _forget_notifier():
+    global _notifier, _admin_digest, _notifier_lock
+    _notifier = None
+    _admin_digest = None
+    _notifier_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_notifier)
+
 # email sending function
 def send_email(to, subject, body):
-    msg = MIMEText(body)
-    msg["Subject"] = subject
-    msg["From"] = EMAIL_USER
-    msg["To"] = to
-
-    with smtplib.SMTP("smtp.gmail.com", 587) as server:
-        server.starttls()
-        server.login(EMAIL_USER, EMAIL_PASSWORD)
-        server.send_message(msg)
-        
+    get_notifier().send(to, subject, body)
+
 # Register client
-@app.route("/register", methods=["GET", "POST"])
+@main.route("/register", methods=["GET", "POST"])
 def register():
     if request.method == "POST":
         name = request.form.get("name", "").strip()
@@ -130,8 +204,8 @@ def register():
             return render_template("register.html")
 
         try:
-            user_record = auth.create_user(email=email, password=password)
-            db.reference(f"users/{user_record.uid}").set({
+            uid = get_store().create_account(email, password)
+            save_user_profile(uid, {
                 "name": name,
                 "surname": surname,
                 "gender": gender,
@@ -140,8 +214,8 @@ def register():
                 "role": role,
             })
             flash("User registered successfully! You can now login.", "success")
-            return redirect(url_for("login"))
-        except auth.EmailAlreadyExistsError:
+            return redirect(url_for("main.login"))
+        except AccountExists:
             flash("Email already registered. Please login.", "danger")
         except Exception as e:
             flash(f"Registration failed: {e}", "danger")
@@ -152,22 +226,27 @@ def register():
 # ------------------------------
 # Login
 # ------------------------------
-@app.route("/login", methods=["GET", "POST"])
+@main.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         email = request.form.get("email")
         password = request.form.get("password")
 
         try:
-            user_record = auth.get_user_by_email(email)
-            user_info = db.reference(f"users/{user_record.uid}").get()
+            # emailIndex first; Firebase Auth only for accounts it does not know yet
+            uid = find_uid(email)
+            user_info = get_user_profile(uid)
+            if not user_info:
+                # The index may still name a deleted account, ask Firebase Auth once more
+                uid = refresh_uid(email)
+                user_info = get_user_profile(uid)
             if not user_info:
                 flash("User not found in database.", "danger")
-                return redirect(url_for("login"))
+                return redirect(url_for("main.login"))
 
             role = user_info.get("role")
             login_user(User(
-                uid=user_record.uid,
+                uid=uid,
                 email=email,
                 role=role,
                 name=user_info.get("name"),
@@ -184,91 +263,343 @@ def login():
                 return redirect(HASHES["admin_dashboard"])
             else:
                 flash("Unknown role.", "danger")
-                return redirect(url_for("login"))
+                return redirect(url_for("main.login"))
 
         except Exception as e:
             flash(f"Login failed: {e}", "danger")
-            return redirect(url_for("login"))
+            return redirect(url_for("main.login"))
 
     return render_template("login.html")
 
 # ------------------------------
 # Logout
 # ------------------------------
-@app.route("/logout")
+@main.route("/logout")
 @login_required
 def logout():
     logout_user()
     flash("Logged out successfully!", "success")
-    return redirect(url_for("login"))
+    return redirect(url_for("main.login"))
 
 # ------------------------------
 # Client Dashboard
 # ------------------------------
-@app.route(HASHES["client_dashboard"])
+@main.route(HASHES["client_dashboard"])
 @login_required
 def client_dashboard():
     if current_user.role != "client":
         flash("Access denied", "danger")
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
 
-    bookings = db.reference("serviceRequests").order_by_child("client_id").equal_to(current_user.id).get() or {}
-    users = db.reference("users").get() or {}
+    # ?history=1 lists the bookings that have been moved to the archive
+    history = request.args.get("history") == "1"
+    client_id = current_user.id
+    load = archived_bookings_for_client if history else bookings_by_client
+    # The mechanic directory does not depend on the bookings, read both at once
+    bookings, _ = gather(lambda: load(client_id), get_mechanics)
+    # Only resolve the mechanics these bookings actually reference
+    mechanics = get_mechanic_profiles([b.get("assigned_mechanic") for b in bookings.values()])
 
     for key, booking in bookings.items():
         mech_id = booking.get("assigned_mechanic")
-        if mech_id and mech_id in users:
-            mech = users[mech_id]
+        if mech_id and mech_id in mechanics:
+            mech = mechanics[mech_id]
             booking["assigned_mechanic_name"] = f"{mech.get('name')} {mech.get('surname')}"
             booking["assigned_mechanic_phone"] = mech.get("phone")
         else:
             booking["assigned_mechanic_name"] = "Not assigned"
             booking["assigned_mechanic_phone"] = "-"
 
-    return render_template("client.html", user=current_user, bookings=bookings, google_maps_api_key=GOOGLE_MAPS_API_KEY)
+    return render_template("client.html", user=current_user, bookings=bookings, history=history,
+                           google_maps_api_key=GOOGLE_MAPS_API_KEY)
 
 # --- MECHANIC DASHBOARD ---
-@app.route(HASHES["mechanic_dashboard"])
+@main.route(HASHES["mechanic_dashboard"])
 @login_required
 def mechanic_dashboard():
     if current_user.role != "mechanic":
         flash("Access denied", "danger")
-        return redirect(url_for("login"))
-    bookings = db.reference("serviceRequests").order_by_child("assigned_mechanic").equal_to(current_user.id).get() or {}
-    return render_template("mechanic.html", user=current_user, bookings=bookings)
+        return redirect(url_for("main.login"))
+    bookings = bookings_by_mechanic(current_user.id)
+    # Listed by service time, with the suggested driving order for the chosen day
+    bookings = dict(sorted(bookings.items(), key=lambda item: item[1].get("service_datetime") or ""))
+    day = parse_day(request.args.get("day"))
+    route = mechanic_route(current_user.id, day, bookings)
+    return render_template("mechanic.html", user=current_user, bookings=bookings, route=route)
+
+
+def parse_day(value):
+    try:
+        return datetime.strptime(value or "", "%Y-%m-%d").date()
+    except ValueError:
+        return date.today()
+
+
+# --- ROUTE PLAN (JSON) ---
+@main.route(HASHES["route_plan"])
+@login_required
+def route_plan():
+    # Mechanics get their own route; admins can ask for any mechanic's
+    if current_user.role == "mechanic":
+        mechanic_id = current_user.id
+    elif current_user.role == "admin" and request.args.get("mechanic_id"):
+        mechanic_id = request.args.get("mechanic_id")
+    else:
+        return jsonify({"error": "Access denied"}), 403
+    return jsonify(mechanic_route(mechanic_id, parse_day(request.args.get("day"))))
+
+# Mechanic closes a job; closed bookings are later moved out by archive.py
+@main.route(HASHES["complete_job"], methods=["POST"])
+@login_required
+def complete_job():
+    if current_user.role != "mechanic":
+        flash("Access denied", "danger")
+        return redirect(url_for("main.login"))
+
+    booking_id = request.form.get("booking_id")
+    booking = get_booking(booking_id) if booking_id else None
+    if not booking or booking.get("assigned_mechanic") != current_user.id:
+        flash("Booking not found.", "danger")
+    elif booking.get("status") in CLOSED_STATUSES:
+        flash("This job is already closed.", "info")
+    else:
+        update_booking(booking_id, {"status": "completed", "completed_at": datetime.now().isoformat()},
+                       booking=booking)
+        schedule.release(booking_id)
+        flash(f"Job {booking.get('reference_number')} marked as completed.", "success")
+    return redirect(url_for("main.mechanic_dashboard"))
 
 # --- ADMIN DASHBOARD ---
-@app.route(HASHES["admin_dashboard"])
+def admin_page():
+    """Filters, one page of bookings, the mechanic directory and nearest-mechanic suggestions."""
+    # One page of bookings at a time, open work only unless asked otherwise
+    filters = {
+        "status": request.args.get("status", "open"),
+        "category": request.args.get("category", ""),
+        "date_from": request.args.get("date_from", ""),
+        "date_to": request.args.get("date_to", ""),
+    }
+    cursor = request.args.get("cursor") or None
+    (bookings, next_cursor), mechanics = gather(
+        lambda: page_bookings(
+            status=filters["status"] or None,
+            category=filters["category"] or None,
+            date_from=filters["date_from"] or None,
+            date_to=filters["date_to"] or None,
+            cursor=cursor,
+            limit=ADMIN_PAGE_SIZE,
+        ),
+        get_mechanics,
+    )
+
+    # Closest available mechanics for every booking with a pinned location
+    suggestions = {}
+    for key, booking in bookings.items():
+        lat, lng = parse_coordinates(booking.get("lat"), booking.get("lng"))
+        if lat is not None:
+            suggestions[key] = nearest_mechanics(lat, lng, NEAREST_MECHANICS)
+    return filters, bookings, next_cursor, mechanics, suggestions
+
+
+# The <option> list of every mechanic, rendered once for each version of the
+# directory (get_mechanics() returns a new dict whenever it reloads)
+_mechanic_options = (None, "")
+
+
+def mechanic_options(mechanics):
+    global _mechanic_options
+    rendered_for, html = _mechanic_options
+    if rendered_for is not mechanics:
+        html = Markup(render_template("mechanic_options.html", mechanics=mechanics))
+        _mechanic_options = (mechanics, html)
+    return html
+
+
+def buffered(chunks, size=4096):
+    """Group the many small pieces a streamed template yields into fewer writes."""
+    pending, length = [], 0
+    try:
+        for chunk in chunks:
+            pending.append(chunk)
+            length += len(chunk)
+            if length >= size:
+                yield "".join(pending)
+                pending, length = [], 0
+        if pending:
+            yield "".join(pending)
+    finally:
+        # Closing the template stream here releases its request context right away
+        chunks.close()
+
+
+@main.route(HASHES["admin_dashboard"])
 @login_required
 def admin_dashboard():
     if current_user.role != "admin":
         flash("Access denied", "danger")
-        return redirect(url_for("login"))
-    bookings = db.reference("serviceRequests").get() or {}
-    users = db.reference("users").get() or {}
-    mechanics = {uid: info for uid, info in users.items() if info.get("role") == "mechanic"}
-    return render_template("admin.html", user=current_user, bookings=bookings, mechanics=mechanics)
-    
-# functions for notifications
-def send_email(to, subject, body):
-    msg = MIMEText(body)
-    msg['Subject'] = subject
-    msg['From'] = EMAIL_USER
-    msg['To'] = to
+        return redirect(url_for("main.login"))
+    filters, bookings, next_cursor, mechanics, suggestions = admin_page()
+
+    # The page is streamed row by row. The mechanic list is sent once and copied into
+    # each row's select by the browser, so the page grows with bookings + mechanics.
+    # Flashes are read here: the session cannot change once streaming has started.
+    return Response(buffered(stream_template(
+        "admin.html", user=current_user, bookings=bookings, mechanic_options=mechanic_options(mechanics),
+        filters=filters, next_cursor=next_cursor, statuses=OPEN_STATUSES + CLOSED_STATUSES, suggestions=suggestions,
+        messages=get_flashed_messages(with_categories=True),
+    )), mimetype="text/html")
+
+
+# Compact data for client-side rendering of the admin table.
+# ?mechanics=0 leaves out the mechanic directory, e.g. when fetching a further page.
+@main.route(HASHES["admin_data"])
+@login_required
+def admin_data():
+    if current_user.role != "admin":
+        return jsonify({"error": "Access denied"}), 403
+    filters, bookings, next_cursor, mechanics, suggestions = admin_page()
+    data = {
+        "bookings": [
+            {
+                "key": key,
+                "client": f"{booking.get('name', '')} {booking.get('surname', '')}".strip(),
+                "vehicle": booking.get("vehicle"),
+                "address": booking.get("address"),
+                "service_datetime": booking.get("service_datetime"),
+                "status": booking.get("status"),
+                "overlap": bool(booking.get("schedule_conflict")),
+                "nearest": [[s["uid"], s["distance_km"]] for s in suggestions.get(key, [])],
+            }
+            for key, booking in bookings.items()
+        ],
+        "next_cursor": next_cursor,
+    }
+    if request.args.get("mechanics") != "0":
+        data["mechanics"] = {uid: f"{m.get('name')} {m.get('surname')}" for uid, m in mechanics.items()}
+    return jsonify(data)
+
+
+# --- ANALYTICS ---
+# Both only read the incrementally maintained counters, never serviceRequests
+@main.route(HASHES["analytics"])
+@login_required
+def analytics():
+    if current_user.role != "admin":
+        flash("Access denied", "danger")
+        return redirect(url_for("main.login"))
+    return render_template("analytics.html", user=current_user, stats=stats.summary(), mechanics=get_mechanics())
+
+
+@main.route(HASHES["stats_api"])
+@login_required
+def stats_api():
+    if current_user.role != "admin":
+        return jsonify({"error": "Access denied"}), 403
+    days = max(1, min(request.args.get("days", 14, type=int), 90))
+    return jsonify(stats.summary(days=days))
+
+
+# --- TRACKING ---
+# Public: anyone with a reference number can check its status, no login needed
+@main.route("/track")
+def track():
+    ref = (request.args.get("ref") or "").strip()
+    status = track_reference(ref) if ref else None
+    response = make_response(render_template("track.html", ref=ref, status=status), 200 if status or not ref else 404)
+    response.headers["Cache-Control"] = f"max-age={TRACK_CACHE_TTL}"
+    return response
+
+
+@main.route("/api/track/<ref>")
+def track_api(ref):
+    status = track_reference(ref)
+    response = jsonify(status) if status else (jsonify({"error": "Reference not found"}), 404)
+    response = make_response(response)
+    response.headers["Cache-Control"] = f"max-age={TRACK_CACHE_TTL}"
+    return response
+
 
-    with smtplib.SMTP("smtp.gmail.com", 587) as server:
-        server.starttls()
-        server.login(EMAIL_USER, EMAIL_PASSWORD)
-        server.send_message(msg)
+# --- NEAREST MECHANICS (JSON) ---
+@main.route(HASHES["nearest_mechanics"])
+@login_required
+def nearest_mechanics_api():
+    if current_user.role != "admin":
+        return jsonify({"error": "Access denied"}), 403
+    booking_id = request.args.get("booking_id")
+    if booking_id:
+        booking = get_booking(booking_id) or {}
+        lat, lng = parse_coordinates(booking.get("lat"), booking.get("lng"))
+    else:
+        lat, lng = parse_coordinates(request.args.get("lat"), request.args.get("lng"))
+    if lat is None:
+        return jsonify({"error": "No service location for this booking"}), 400
+    k = request.args.get("k", NEAREST_MECHANICS, type=int)
+    return jsonify({"lat": lat, "lng": lng, "mechanics": nearest_mechanics(lat, lng, max(1, min(k, 50)))})
+
+
+# --- LIVE UPDATES (Server-Sent Events) ---
+@main.route(HASHES["events"])
+@login_required
+def events():
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    subscriber = feed.subscribe(booking_filter(current_user.role, current_user.id), last_event_id)
+    if subscriber is None:
+        # Every stream slot of this worker is taken; live.js tries again later
+        response = make_response("Too many live connections", 503)
+        response.headers["Retry-After"] = "30"
+        return response
+
+    def describe(booking):
+        mechanic = get_mechanics().get(booking.get("assigned_mechanic")) or {}
+        if not mechanic:
+            return {"assigned_mechanic_name": "Not assigned", "assigned_mechanic_phone": "-"}
+        return {
+            "assigned_mechanic_name": f"{mechanic.get('name')} {mechanic.get('surname')}",
+            "assigned_mechanic_phone": mechanic.get("phone"),
+        }
+
+    response = Response(stream_with_context(feed.stream(subscriber, describe)), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+# --- FREE SLOTS (JSON, used by the booking form) ---
+@main.route(HASHES["free_slots"])
+@login_required
+def free_slots():
+    try:
+        day = datetime.strptime(request.args.get("date", ""), "%Y-%m-%d").date()
+    except ValueError:
+        return jsonify({"error": "Invalid date"}), 400
+    category = request.args.get("category") or None
+    return jsonify({"date": day.isoformat(), "slots": schedule.free_slots(day, category)})
 
 
+# --- MECHANIC LOCATION (reported by the mechanic dashboard) ---
+@main.route(HASHES["mechanic_location"], methods=["POST"])
+@login_required
+def mechanic_location():
+    if current_user.role != "mechanic":
+        return jsonify({"error": "Access denied"}), 403
+    data = request.get_json(silent=True) or request.form
+    lat, lng = parse_coordinates(data.get("lat"), data.get("lng"))
+    if lat is None:
+        return jsonify({"error": "Invalid coordinates"}), 400
+    changes = {"lat": lat, "lng": lng, "updated_at": datetime.now().isoformat()}
+    if "available" in data:
+        changes["available"] = str(data.get("available")).lower() in ("1", "true", "yes", "on")
+    update_mechanic_location(current_user.id, changes)
+    return jsonify({"status": "ok"})
+    
+
 # --- Book Service Route ---
-@app.route("/book_service", methods=["POST"])
+@main.route("/book_service", methods=["POST"])
 @login_required
 def book_service():
     if getattr(current_user, "role", None) != "client":
         flash("Access denied", "danger")
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
 
     # Get form data safely
     address = request.form.get("address", "").strip()
@@ -278,6 +609,7 @@ def book_service():
     service_date = request.form.get("service_date", "").strip()
     service_time = request.form.get("service_time", "").strip()
     description = request.form.get("description", "").strip()
+    lat, lng = parse_coordinates(request.form.get("lat"), request.form.get("lng"))
 
     # Validate required fields
     if not all([address, vehicle, make_model, category, service_date, service_time, description]):
@@ -295,18 +627,16 @@ def book_service():
         flash("Invalid date or time format.", "danger")
         return redirect(HASHES.get("client_dashboard", "/"))
 
-    # Generate reference number
-    reference_number = "REF-" + secrets.token_hex(5).upper()
-
     # Prepare booking data safely, fallback to defaults if first-time user
     booking_data = {
-        "reference_number": reference_number,
         "client_id": getattr(current_user, "id", "unknown_id"),
         "name": getattr(current_user, "name", "Unknown"),
         "surname": getattr(current_user, "surname", ""),
         "phone": getattr(current_user, "phone", ""),
         "email": getattr(current_user, "email", ""),
         "address": address,
+        "lat": lat,
+        "lng": lng,
         "vehicle": vehicle,
         "make_model": make_model,
         "category": category,
@@ -317,32 +647,33 @@ def book_service():
         "timestamp": datetime.now().isoformat()
     }
 
-    # Save booking to Firebase
+    # Save booking to the database; this also allocates the unique reference number
     try:
-        booking_ref = db.reference("serviceRequests").push()
-        booking_ref.set(booking_data)
+        _, reference_number = create_booking(booking_data)
         print(f"Service request saved: {reference_number}")
     except Exception as e:
         flash(f"Failed to save booking: {e}", "danger")
         return redirect(HASHES.get("client_dashboard", "/"))
 
-    # Notify admins
+    # Notify admins, immediately or through the digest
+    admin_body = (
+        f"New service request received:\n"
+        f"Reference: {reference_number}\n"
+        f"Client: {booking_data['name']} {booking_data['surname']}\n"
+        f"Vehicle: {vehicle}\n"
+        f"Category: {category}\n"
+        f"Date/Time: {service_datetime_str}\n"
+        f"Address: {address}\n"
+        f"Description: {description}"
+    )
     for admin in ADMINS:
         admin_email = admin.get("email")
         if admin_email:
             try:
-                send_email(
-                    admin_email,
-                    "New Service Request",
-                    f"New service request received:\n"
-                    f"Reference: {reference_number}\n"
-                    f"Client: {booking_data['name']} {booking_data['surname']}\n"
-                    f"Vehicle: {vehicle}\n"
-                    f"Category: {category}\n"
-                    f"Date/Time: {service_datetime_str}\n"
-                    f"Address: {address}\n"
-                    f"Description: {description}"
-                )
+                if not ADMIN_DIGEST_MINUTES or category in admin.get("urgent_categories", ()):
+                    send_email(admin_email, "New Service Request", admin_body)
+                else:
+                    get_admin_digest().add(admin_email, admin_body)
             except Exception as e:
                 print(f"Failed to send email to admin {admin_email}: {e}")
 
@@ -355,6 +686,7 @@ def book_service():
                 "Service Request Received",
                 f"Hi {booking_data['name']}, your service request has been received.\n"
                 f"Reference: {reference_number}\n"
+                f"Track it at: {url_for('main.track', ref=reference_number, _external=True)}\n"
                 f"Vehicle: {vehicle}\n"
                 f"Category: {category}\n"
                 f"Date/Time: {service_datetime_str}\n"
@@ -369,12 +701,12 @@ def book_service():
 
 
 # Logged in Administrator can add mechanic
-@app.route(HASHES["new_mechanic"], methods=["GET", "POST"])
+@main.route(HASHES["new_mechanic"], methods=["GET", "POST"])
 @login_required
 def newmechanic():
     if current_user.role != "admin":
         flash("Access denied", "danger")
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
     if request.method == "POST":
         name = request.form.get("name")
         surname = request.form.get("surname")
@@ -382,6 +714,7 @@ def newmechanic():
         phone = request.form.get("phone")
         password = request.form.get("password")
         confirm_password = request.form.get("confirm_password")
+        base_lat, base_lng = parse_coordinates(request.form.get("base_lat"), request.form.get("base_lng"))
 
         if not all([name, surname, email, phone, password, confirm_password]):
             flash("All fields are required.", "danger")
@@ -390,28 +723,27 @@ def newmechanic():
             flash("Passwords do not match.", "danger")
             return render_template("newmechanic.html")
 
-        try:
-            existing_user = auth.get_user_by_email(email)
-            if existing_user:
-                flash("Email already exists.", "danger")
-                return render_template("newmechanic.html")
-        except auth.UserNotFoundError:
-            pass
-        except Exception as e:
-            flash(f"Error: {e}", "danger")
+        # Known emails are caught by the index; creating the account catches the rest
+        if indexed_uid(email):
+            flash("Email already exists.", "danger")
             return render_template("newmechanic.html")
 
         try:
-            user_record = auth.create_user(email=email, password=password)
-            db.reference(f"users/{user_record.uid}").set({
+            uid = get_store().create_account(email, password)
+            save_user_profile(uid, {
                 "name": name,
                 "surname": surname,
                 "email": email,
                 "phone": phone,
                 "role": "mechanic"
             })
+            if base_lat is not None:
+                update_mechanic_location(uid, {"base_lat": base_lat, "base_lng": base_lng})
             flash("Mechanic created successfully!", "success")
             return redirect(HASHES["admin_dashboard"])
+        except AccountExists:
+            flash("Email already exists.", "danger")
+            return render_template("newmechanic.html")
         except Exception as e:
             flash(f"Failed to create mechanic: {e}", "danger")
             return render_template("newmechanic.html")
@@ -420,12 +752,12 @@ def newmechanic():
 
 # Assigning a mechanic to a selected request.
 # Both Mechanic and client (Requester) will receive nootifaction after the administrator has assigned a mechanic 
-@app.route(HASHES["assign_mechanic"], methods=["POST"])
+@main.route(HASHES["assign_mechanic"], methods=["POST"])
 @login_required
 def assign_mechanic():
     if current_user.role != "admin":
         flash("Access denied", "danger")
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
 
     booking_id = request.form.get("booking_id")
     mechanic_id = request.form.get("mechanic_id")
@@ -435,15 +767,49 @@ def assign_mechanic():
         return redirect(HASHES["admin_dashboard"])
 
     try:
-        # Update the booking in Firebase
-        booking_ref = db.reference(f"serviceRequests/{booking_id}")
-        booking_ref.update({
-            "assigned_mechanic": mechanic_id,
-            "status": "assigned"
-        })
+        # "nearest" picks the closest available mechanic to the service location,
+        # which needs the booking first; otherwise both are read at once
+        if mechanic_id == "nearest":
+            booking = get_booking(booking_id)
+            if not booking:
+                raise ValueError("Booking not found")
+            lat, lng = parse_coordinates(booking.get("lat"), booking.get("lng"))
+            nearest = nearest_mechanics(lat, lng, 1) if lat is not None else []
+            if not nearest:
+                raise ValueError("No available mechanic with a known location")
+            mechanic_id = nearest[0]["uid"]
+            mechanics = get_mechanic_profiles([mechanic_id])
+        else:
+            booking, mechanics = gather(lambda: get_booking(booking_id),
+                                        lambda: get_mechanic_profiles([mechanic_id]))
+            if not booking:
+                raise ValueError("Booking not found")
+
+        # Get mechanic details
+        mechanic = mechanics.get(mechanic_id)
+        if not mechanic:
+            raise ValueError("Selected mechanic no longer exists")
+
+        # Refuse to double-book the mechanic unless the admin allows the overlap. The
+        # check sees jobs assigned by other workers, and holds off this process's other
+        # assignments to the mechanic until the booking is written.
+        with schedule.holding(mechanic_id):
+            conflicts = schedule.conflicts(mechanic_id, booking_id, booking)
+            if conflicts and not request.form.get("allow_overlap"):
+                times = ", ".join(f"{start:%H:%M}-{end:%H:%M}" for start, end, _ in conflicts)
+                flash(f"{mechanic.get('name')} {mechanic.get('surname')} already has a job at {times}. "
+                      f"Tick 'Allow overlap' to assign anyway.", "danger")
+                return redirect(HASHES["admin_dashboard"])
+
+            # Update the booking in the database
+            booking = update_booking(booking_id, {
+                "assigned_mechanic": mechanic_id,
+                "status": "assigned",
+                "schedule_conflict": bool(conflicts) or None,
+            }, booking=booking)
+            schedule.assign(mechanic_id, booking_id, booking)
 
         # Get booking details
-        booking = booking_ref.get()
         client_email = booking.get("email")
         client_phone = booking.get("phone")
         vehicle = booking.get("vehicle")
@@ -453,8 +819,6 @@ def assign_mechanic():
         client_name = booking.get("name")
         description = booking.get("description")
 
-        # Get mechanic details
-        mechanic = db.reference(f"users/{mechanic_id}").get()
         mechanic_email = mechanic.get("email")
         mechanic_phone = mechanic.get("phone")
         mechanic_name = mechanic.get("name")
@@ -488,11 +852,218 @@ def assign_mechanic():
 
     return redirect(HASHES["admin_dashboard"])
  
+def _bulk_assign(pairs, allow_overlap):
+    # Reads, checks and writes the assignments. Returns (updated, skipped, bookings, mechanics)
+    bookings, mechanics = gather(lambda: get_bookings(pairs), get_mechanics)
+    assigned = {}
+    skipped = {}
+    batch = {}  # mechanic_id -> Calendar of jobs assigned in this batch
+
+    chosen = {}
+    for booking_id, mechanic_id in pairs.items():
+        booking = bookings.get(booking_id)
+        if not booking:
+            skipped[booking_id] = "booking not found"
+            continue
+        if mechanic_id == "nearest":
+            lat, lng = parse_coordinates(booking.get("lat"), booking.get("lng"))
+            nearest = nearest_mechanics(lat, lng, 1) if lat is not None else []
+            mechanic_id = nearest[0]["uid"] if nearest else None
+        if mechanic_id not in mechanics:
+            skipped[booking_id] = "mechanic not found"
+            continue
+        chosen[booking_id] = mechanic_id
+
+    # Same as assign_mechanic: fresh calendars, and no other assignment to these
+    # mechanics from this process until the batch is written
+    windows = {}
+    for booking_id, mechanic_id in chosen.items():
+        interval = job_interval(bookings[booking_id])
+        if interval:
+            start, end = windows.get(mechanic_id, interval)
+            windows[mechanic_id] = (min(start, interval[0]), max(end, interval[1]))
+    with schedule.holding(*chosen.values()):
+        # Only the hours each mechanic is being given work in are read again
+        gather(*[partial(schedule.reload, mechanic_id, *window) for mechanic_id, window in windows.items()])
+        for booking_id, mechanic_id in chosen.items():
+            booking = bookings[booking_id]
+            interval = job_interval(booking)
+            conflicts = schedule.conflicts(mechanic_id, booking_id, booking, fresh=False)
+            if interval and mechanic_id in batch:
+                conflicts += batch[mechanic_id].overlapping(*interval)
+            if conflicts and not allow_overlap:
+                skipped[booking_id] = "mechanic already booked at that time"
+                continue
+            if interval:
+                batch.setdefault(mechanic_id, Calendar()).add(*interval, booking_id)
+            assigned[booking_id] = {
+                "assigned_mechanic": mechanic_id,
+                "status": "assigned",
+                "schedule_conflict": bool(conflicts) or None,
+            }
+
+        updated = update_bookings(assigned, bookings) if assigned else {}
+        for booking_id, booking in updated.items():
+            schedule.assign(booking["assigned_mechanic"], booking_id, booking)
+    return updated, skipped, bookings, mechanics
+
+
+# Assigning many requests at once (morning dispatch).
+# Accepts the admin table's "assign-<booking_id>" fields or JSON
+# {"assignments": [{"booking_id": ..., "mechanic_id": ...}], "allow_overlap": false}.
+# All bookings are read in one batch, written in one multi-location update, and every
+# mechanic and client gets a single email listing all of their jobs.
+@main.route(HASHES["bulk_assign"], methods=["POST"])
+@login_required
+def bulk_assign():
+    wants_json = request.is_json
+    if current_user.role != "admin":
+        if wants_json:
+            return jsonify({"error": "Access denied"}), 403
+        flash("Access denied", "danger")
+        return redirect(url_for("main.login"))
+
+    data = None
+    if wants_json:
+        data = request.get_json(silent=True)
+        if data is None:
+            return jsonify({"error": "Request body is not valid JSON"}), 400
+        assignments = data.get("assignments", []) if isinstance(data, dict) else None
+        if not isinstance(assignments, list) or not all(
+                isinstance(a, dict) and isinstance(a.get("booking_id"), str) and isinstance(a.get("mechanic_id"), str)
+                for a in assignments):
+            return jsonify({"error": 'Expected {"assignments": [{"booking_id": "...", "mechanic_id": "..."}]}'}), 400
+        pairs = {a["booking_id"]: a["mechanic_id"] for a in assignments}
+        allow_overlap = bool(data.get("allow_overlap"))
+    else:
+        pairs = {name[len("assign-"):]: value for name, value in request.form.items()
+                 if name.startswith("assign-") and value}
+        allow_overlap = bool(request.form.get("allow_overlap"))
+    pairs = {booking_id: mechanic_id for booking_id, mechanic_id in pairs.items() if booking_id and mechanic_id}
+
+    try:
+        updated, skipped, bookings, mechanics = _bulk_assign(pairs, allow_overlap)
+    except Exception as e:
+        # Same as assign_mechanic: report the failure instead of a 500
+        if wants_json:
+            return jsonify({"error": f"Failed to assign mechanics: {e}"}), 503
+        flash(f"Failed to assign mechanics: {e}", "danger")
+        return redirect(HASHES["admin_dashboard"])
+
+    # One consolidated email per mechanic and per client
+    jobs_by_mechanic = {}
+    jobs_by_client = {}
+    for booking in updated.values():
+        jobs_by_mechanic.setdefault(booking["assigned_mechanic"], []).append(booking)
+        if booking.get("email"):
+            jobs_by_client.setdefault(booking["email"], []).append(booking)
+
+    for mechanic_id, jobs in jobs_by_mechanic.items():
+        mechanic = mechanics[mechanic_id]
+        lines = [
+            f"Reference: {b.get('reference_number')}\nClient: {b.get('name')}\nVehicle: {b.get('vehicle')}\n"
+            f"Category: {b.get('category')}\nDescription: {b.get('description')}\nDate/Time: {b.get('service_datetime')}\n"
+            f"Address: {b.get('address')}\nPhone: {b.get('phone')}\nEmail: {b.get('email')}"
+            for b in sorted(jobs, key=lambda b: b.get("service_datetime") or "")
+        ]
+        send_email(
+            mechanic.get("email"),
+            f"{len(jobs)} New Service(s) Assigned",
+            f"Hi {mechanic.get('name')},\n\nYou have been assigned to the following service requests:\n\n"
+            + "\n\n".join(lines) + "\n\nPlease contact the clients if needed."
+        )
+
+    for client_email, jobs in jobs_by_client.items():
+        lines = []
+        for b in jobs:
+            mechanic = mechanics[b["assigned_mechanic"]]
+            lines.append(
+                f"Reference: {b.get('reference_number')}\nMechanic: {mechanic.get('name')} {mechanic.get('surname')}\n"
+                f"Mechanic Phone: {mechanic.get('phone')}\nVehicle: {b.get('vehicle')}\nCategory: {b.get('category')}\n"
+                f"Date/Time: {b.get('service_datetime')}\nAddress: {b.get('address')}"
+            )
+        send_email(
+            client_email,
+            "Mechanic Assigned",
+            f"Hi {jobs[0].get('name')},\n\nA mechanic has been assigned to your service request(s):\n\n"
+            + "\n\n".join(lines) + "\n\nThank you!"
+        )
+
+    if wants_json:
+        return jsonify({"assigned": sorted(updated), "skipped": skipped})
+    if updated:
+        flash(f"{len(updated)} booking(s) assigned. Notifications sent to clients and mechanics.", "success")
+    for booking_id, reason in skipped.items():
+        flash(f"Booking {bookings.get(booking_id, {}).get('reference_number', booking_id)} not assigned: {reason}.", "danger")
+    return redirect(HASHES["admin_dashboard"])
+
+
+# Prometheus scrape endpoint, protected by METRICS_TOKEN when it is set
+@main.route("/metrics")
+def metrics_endpoint():
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return "Unauthorized", 401
+    return Response(metrics.expose(), mimetype="text/plain; version=0.0.4")
+
+
 # This portion handles flavicon.ico error 
-@app.route('/favicon.ico')
+@main.route('/favicon.ico')
 def favicon():
     return '', 204  # 204 = No Content
 
-# Entry point of the application
+# Warm-up hooks run by warm_up(): once per worker process, before it takes traffic
+# (see gunicorn.conf.py), so the first request does not pay for opening connections.
+WARM_UP_HOOKS = []
+
+
+def on_warm_up(func):
+    WARM_UP_HOOKS.append(func)
+    return func
+
+
+@on_warm_up
+def _open_store():
+    get_store()
+
+
+@on_warm_up
+def _load_mechanics():
+    get_mechanics()
+
+
+@on_warm_up
+def _start_notifier():
+    get_notifier().start()
+
+
+def warm_up():
+    for hook in WARM_UP_HOOKS:
+        try:
+            hook()
+        except Exception as e:
+            print(f"Warm-up {hook.__name__} failed: {e}")
+
+
+def create_app(config=None):
+    """Build the Flask app. config overrides app.config, e.g. {"TESTING": True}."""
+    app = Flask(__name__)
+    app.secret_key = FLASK_SECRET_KEY
+    app.config["WARM_UP"] = False
+    app.config.update(config or {})
+
+    # Every database and Auth call is timed for /metrics, whichever store is in use
+    wrap_store(metrics.InstrumentedStore)
+    metrics.init_app(app)
+    login_manager.init_app(app)
+    # Hashed, precompressed files from `python assets.py build`, when there is a build
+    assets.init_app(app)
+    app.register_blueprint(main)
+
+    if app.config["WARM_UP"]:
+        warm_up()
+    return app
+
+
+# Entry point for local development; production runs wsgi:app under gunicorn
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    create_app().run(host="0.0.0.0", port=5000, debug=os.getenv("FLASK_DEBUG", "1") == "1")
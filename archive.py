@@ -0,0 +1,131 @@
+# Archival of finished service requests.
+# Closed bookings (and any booking whose service date is long past) are moved out of
+# serviceRequests into monthly partitions, so the hot node the dashboards query stays
+# small. Each batch is one multi-location update that writes the archived copies and
+# their lookup entries and removes the originals:
+#
+#   serviceRequestsArchive/<yyyy-mm>/<key>    the booking
+#   archiveByReference/<reference_number>     "<yyyy-mm>/<key>"
+#   archiveByClient/<client_id>/<key>         "<yyyy-mm>"
+#   archiveMonths/<yyyy-mm>                   true
+#
+# Usage: python archive.py [--closed-days 30] [--max-age-days 365] [--batch 500] [--dry-run]
+
+import argparse
+from datetime import datetime, timedelta
+from bookings import CLOSED_STATUSES, INDEX_FIELDS, booking_by_reference
+from storage import get_store, scan
+
+ARCHIVE = "serviceRequestsArchive"
+
+
+def partition(booking):
+    """Archive partition (yyyy-mm) for a booking, by service date, falling back to creation time."""
+    when = booking.get("service_datetime") or booking.get("timestamp") or ""
+    return when[:7] if len(when) >= 7 else "undated"
+
+
+def _candidates(field, prefix, cutoff, batch_size, accept):
+    # Walk one index range in batches, oldest service date first
+    for batch in scan("serviceRequests", batch_size, order_by=field, start=f"{prefix}|", end=f"{prefix}|{cutoff}"):
+        for key, booking in batch.items():
+            if accept(booking):
+                yield key, booking
+
+
+def archive_batch(store, rows):
+    updates = {}
+    for key, booking in rows:
+        month = partition(booking)
+        record = {field: value for field, value in booking.items() if field not in INDEX_FIELDS}
+        record["archived_at"] = datetime.now().isoformat()
+        updates[f"{ARCHIVE}/{month}/{key}"] = record
+        updates[f"serviceRequests/{key}"] = None
+        updates[f"archiveMonths/{month}"] = True
+        if booking.get("reference_number"):
+            updates[f"archiveByReference/{booking['reference_number']}"] = f"{month}/{key}"
+        if booking.get("client_id"):
+            updates[f"archiveByClient/{booking['client_id']}/{key}"] = month
+    store.update("", updates)
+
+
+def archive_bookings(closed_days=30, max_age_days=365, batch_size=500, dry_run=False, now=None):
+    """Move closed bookings older than closed_days, and any booking older than max_age_days."""
+    store = get_store()
+    now = now or datetime.now()
+    closed_cutoff = (now - timedelta(days=closed_days)).strftime("%Y-%m-%d %H:%M")
+    stale_cutoff = (now - timedelta(days=max_age_days)).strftime("%Y-%m-%d %H:%M")
+
+    moved = 0
+    seen = set()
+    sources = [
+        _candidates("idx_open", "closed", closed_cutoff, batch_size,
+                    lambda b: b.get("status") in CLOSED_STATUSES),
+        _candidates("idx_date", "all", stale_cutoff, batch_size, lambda b: True),
+    ]
+    for source in sources:
+        rows = []
+        for key, booking in source:
+            if key in seen:
+                continue
+            seen.add(key)
+            rows.append((key, booking))
+            if len(rows) >= batch_size:
+                if not dry_run:
+                    archive_batch(store, rows)
+                moved += len(rows)
+                print(f"{'Found' if dry_run else 'Archived'} {moved} bookings")
+                rows = []
+        if rows:
+            if not dry_run:
+                archive_batch(store, rows)
+            moved += len(rows)
+            print(f"{'Found' if dry_run else 'Archived'} {moved} bookings")
+    return moved
+
+
+def find_archived_by_reference(reference_number):
+    """Return (key, booking) for an archived reference number, or (None, None)."""
+    store = get_store()
+    location = store.get(f"archiveByReference/{reference_number}")
+    if not location:
+        return None, None
+    booking = store.get(f"{ARCHIVE}/{location}")
+    return (location.split("/", 1)[1], booking) if booking else (None, None)
+
+
+def archived_bookings_for_client(client_id):
+    """All archived bookings of a client as {key: booking}."""
+    store = get_store()
+    months = store.get(f"archiveByClient/{client_id}") or {}
+    found = store.get_many(f"{ARCHIVE}/{month}/{key}" for key, month in months.items())
+    return {path.rsplit("/", 1)[1]: booking for path, booking in found.items() if booking}
+
+
+def lookup_reference(reference_number):
+    """Find a booking by reference number in the hot node, then in the archive."""
+    key, booking = booking_by_reference(reference_number)
+    if booking is None:
+        key, booking = find_archived_by_reference(reference_number)
+    return key, booking
+
+
+def archive_months():
+    return sorted(get_store().get("archiveMonths") or {})
+
+
+def archived_bookings(month):
+    return get_store().get(f"{ARCHIVE}/{month}") or {}
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Move finished service requests to the archive")
+    parser.add_argument("--closed-days", type=int, default=30, help="archive closed bookings older than this")
+    parser.add_argument("--max-age-days", type=int, default=365, help="archive any booking older than this")
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    total = archive_bookings(args.closed_days, args.max_age_days, args.batch, args.dry_run)
+    print(f"{total} booking(s) {'would be ' if args.dry_run else ''}archived")
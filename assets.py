@@ -0,0 +1,171 @@
+# Static asset build and serving.
+# `python assets.py build` copies every file under static/ to static/dist/ with a
+# content hash in its name (live.js -> live.3f9a1c0b2e.js), writes gzip and, when the
+# brotli package is installed, brotli variants of text assets, and resized WebP
+# versions of the images when Pillow is installed. static/dist/manifest.json maps the
+# original names to the built ones.
+#
+# At runtime url_for('static', filename='live.js') is rewritten to the hashed file,
+# which is served with the best precompressed variant the browser accepts and cached
+# for a year, since a changed file gets a new name. Without a build the app serves
+# static/ as before.
+
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from flask import current_app, request, send_from_directory, url_for
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+
+COMPRESSIBLE = (".css", ".js", ".svg", ".json", ".txt", ".html")
+IMAGES = (".png", ".jpg", ".jpeg")
+# Widths of the WebP versions; images are never scaled up
+WEBP_WIDTHS = (1920, 1280, 768)
+WEBP_QUALITY = 80
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+mimetypes.add_type("image/webp", ".webp")
+
+
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            digest.update(block)
+    return digest.hexdigest()[:10]
+
+
+def _hashed_name(name, digest, suffix=None):
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{digest}{suffix or ext}"
+
+
+def _compress(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    with gzip.open(path + ".gz", "wb", compresslevel=9) as f:
+        f.write(data)
+    try:
+        import brotli
+    except ImportError:
+        return False
+    with open(path + ".br", "wb") as f:
+        f.write(brotli.compress(data, quality=11))
+    return True
+
+
+def _webp_versions(source, name, digest):
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    versions = {}
+    with Image.open(source) as image:
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        for width in WEBP_WIDTHS:
+            if width > image.width and versions:
+                continue
+            width = min(width, image.width)
+            height = round(image.height * width / image.width)
+            built = _hashed_name(name, digest, f".w{width}.webp")
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            resized.save(os.path.join(DIST_DIR, built), "WEBP", quality=WEBP_QUALITY, method=6)
+            versions[width] = built.replace(os.sep, "/")
+    return versions
+
+
+def build(clean=True):
+    """Build static/dist/ and its manifest. Returns the manifest."""
+    if clean and os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    os.makedirs(DIST_DIR, exist_ok=True)
+    manifest = {}
+    missing = set()
+    for root, dirs, files in os.walk(STATIC_DIR):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != DIST_DIR]
+        for filename in sorted(files):
+            source = os.path.join(root, filename)
+            name = os.path.relpath(source, STATIC_DIR)
+            digest = content_hash(source)
+            built = _hashed_name(name, digest)
+            target = os.path.join(DIST_DIR, built)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(source, target)
+            entry = {"file": built.replace(os.sep, "/")}
+            ext = os.path.splitext(filename)[1].lower()
+            if ext in COMPRESSIBLE:
+                if not _compress(target):
+                    missing.add("brotli (no .br files)")
+            elif ext in IMAGES:
+                webp = _webp_versions(source, name, digest)
+                if webp is None:
+                    missing.add("Pillow (no WebP images)")
+                else:
+                    entry["webp"] = webp
+            manifest[name.replace(os.sep, "/")] = entry
+            print(f"{name} -> {entry['file']}")
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    for package in sorted(missing):
+        print(f"Skipped: install {package}")
+    return manifest
+
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def serve_asset(filename):
+    """A built asset, precompressed when the browser accepts it, cached for good."""
+    accepted = request.headers.get("Accept-Encoding", "")
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    served, encoding = filename, None
+    for candidate in ("br", "gzip"):
+        suffix = ".br" if candidate == "br" else ".gz"
+        if candidate in accepted and os.path.exists(os.path.join(DIST_DIR, filename + suffix)):
+            served, encoding = filename + suffix, candidate
+            break
+    response = send_from_directory(DIST_DIR, served, mimetype=mimetype, max_age=31536000)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if os.path.splitext(filename)[1].lower() in COMPRESSIBLE:
+        response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = IMMUTABLE
+    return response
+
+
+def init_app(app):
+    """Serve static/dist/ and point url_for('static', ...) at the built files, if built."""
+    manifest = load_manifest()
+    app.extensions["assets"] = manifest
+    app.add_url_rule("/static/dist/<path:filename>", "assets", serve_asset)
+
+    @app.url_defaults
+    def _hashed_static(endpoint, values):
+        if endpoint == "static" and values.get("filename") in manifest:
+            values["filename"] = "dist/" + manifest[values["filename"]]["file"]
+
+    @app.template_global()
+    def webp_srcset(filename):
+        """srcset of the WebP versions of an image, or "" when there are none."""
+        versions = current_app.extensions["assets"].get(filename, {}).get("webp") or {}
+        return ", ".join(f"{url_for('assets', filename=built)} {width}w"
+                         for width, built in sorted(versions.items(), key=lambda v: int(v[0])))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build fingerprinted, precompressed static assets")
+    parser.add_argument("command", choices=("build",))
+    parser.add_argument("--no-clean", action="store_true", help="keep files from earlier builds")
+    args = parser.parse_args()
+    manifest = build(clean=not args.no_clean)
+    print(f"{len(manifest)} asset(s) written to {DIST_DIR}")
@@ -0,0 +1,92 @@
+# Synthetic users and bookings for the benchmarks.
+# Usage: python -m benchmarks.datasets --bookings 100000 --out bench.db
+
+import argparse
+import random
+from datetime import datetime, timedelta
+
+CATEGORIES = ("Heavy", "Light")
+STATUSES = ("pending", "assigned", "completed")
+CENTER = (-25.7479, 28.2293)
+
+
+def generate(store, bookings=10000, clients=1000, mechanics=50, seed=1, chunk=1000):
+    """Fill store with users and bookings. Returns {"clients": [...], "mechanics": [...], "admins": [...]}."""
+    from bookings import index_fields
+    from storage import push_key
+    from users import mechanic_entry
+
+    rng = random.Random(seed)
+    ids = {"clients": [], "mechanics": [], "admins": []}
+    updates = {}
+
+    def flush(force=False):
+        if updates and (force or len(updates) >= chunk):
+            store.update("", dict(updates))
+            updates.clear()
+
+    def add_user(role, i):
+        uid = f"{role}{i:06d}"
+        profile = {"name": f"{role.title()}{i}", "surname": "Bench", "email": f"{uid}@bench.local",
+                   "phone": f"+2710{i:07d}", "role": role}
+        updates[f"users/{uid}"] = profile
+        if role == "mechanic":
+            updates[f"mechanics/{uid}"] = mechanic_entry(profile)
+            updates[f"mechanicLocations/{uid}"] = {
+                "base_lat": CENTER[0] + rng.uniform(-0.3, 0.3),
+                "base_lng": CENTER[1] + rng.uniform(-0.3, 0.3),
+            }
+        ids[role + "s"].append(uid)
+        flush()
+
+    add_user("admin", 0)
+    for i in range(mechanics):
+        add_user("mechanic", i)
+    for i in range(clients):
+        add_user("client", i)
+
+    start = datetime.now() - timedelta(days=365)
+    for i in range(bookings):
+        key = push_key()
+        client = rng.choice(ids["clients"])
+        when = start + timedelta(days=rng.randint(0, 400), hours=rng.randint(8, 16))
+        status = rng.choice(STATUSES)
+        booking = {
+            "reference_number": f"REF-B{i:09d}",
+            "client_id": client,
+            "name": client,
+            "surname": "Bench",
+            "phone": "+27100000000",
+            "email": f"{client}@bench.local",
+            "address": f"{i} Bench Street",
+            "lat": CENTER[0] + rng.uniform(-0.3, 0.3),
+            "lng": CENTER[1] + rng.uniform(-0.3, 0.3),
+            "vehicle": f"BENCH{i}",
+            "make_model": "Bench 2020",
+            "category": rng.choice(CATEGORIES),
+            "service_datetime": when.strftime("%Y-%m-%d %H:%M"),
+            "status": status,
+            "description": "Generated booking",
+            "timestamp": when.isoformat(),
+        }
+        if status != "pending":
+            booking["assigned_mechanic"] = rng.choice(ids["mechanics"])
+        booking.update(index_fields(key, booking))
+        updates[f"serviceRequests/{key}"] = booking
+        flush()
+    flush(force=True)
+    return ids
+
+
+if __name__ == "__main__":
+    from storage import SQLiteStore
+
+    parser = argparse.ArgumentParser(description="Generate a benchmark dataset into a SQLite store")
+    parser.add_argument("--bookings", type=int, default=10000)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--mechanics", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", required=True, help="SQLite file to write")
+    args = parser.parse_args()
+    generate(SQLiteStore(args.out), args.bookings, args.clients, args.mechanics, args.seed)
+    print(f"Wrote {args.bookings} bookings to {args.out}")
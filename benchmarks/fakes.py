@@ -0,0 +1,79 @@
+# Local stand-ins used by the benchmarks: a store wrapper that adds network-like
+# latency to every call, and an SMTP server that accepts and discards mail.
+
+import random
+import socketserver
+import threading
+import time
+
+
+# Wraps any store from storage.py and sleeps before each call to mimic the round
+# trip to the Firebase servers.
+class LatencyStore:
+    CALLS = ("get", "get_many", "set", "update", "claim", "query", "create_account", "find_account",
+             "delete_account")
+
+    def __init__(self, store, latency_ms=0.0, jitter_ms=0.0):
+        self._store = store
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.calls = 0
+
+    def _delay(self):
+        self.calls += 1
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def __getattr__(self, name):
+        attr = getattr(self._store, name)
+        if name not in self.CALLS:
+            return attr
+
+        def call(*args, **kwargs):
+            self._delay()
+            return attr(*args, **kwargs)
+        return call
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        self.reply("220 smtp-sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith("EHLO") or command.startswith("HELO"):
+                self.reply("250 smtp-sink")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b".\r\n", b".\n"):
+                        break
+                self.server.messages += 1
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                # MAIL, RCPT, RSET, NOOP
+                self.reply("250 OK")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), _SMTPHandler)
+        self.messages = 0
+        self.port = self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="smtp-sink", daemon=True).start()
+        return self
@@ -0,0 +1,192 @@
+# Benchmark the main routes against a local SQLite store and SMTP sink.
+#
+#   python -m benchmarks.run --bookings 10000 --requests 200 --latency-ms 20
+#   python -m benchmarks.run --save-baseline benchmarks/baseline.json
+#   python -m benchmarks.run --baseline benchmarks/baseline.json --tolerance 0.25
+#
+# The last form exits with status 1 when a route's p95 is slower than the stored
+# baseline by more than the tolerance.
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.fakes import LatencyStore, SMTPSink
+from benchmarks.datasets import generate
+
+ROUTES = ("book_service", "assign_mechanic", "client_dashboard", "mechanic_dashboard", "admin_dashboard")
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def setup(args):
+    """Create the store, SMTP sink and app. Returns (app module, Flask app, user ids, sink, store)."""
+    sink = SMTPSink().start()
+    os.environ.update({
+        "STORAGE_BACKEND": "sqlite",
+        "SMTP_HOST": "127.0.0.1",
+        "SMTP_PORT": str(sink.port),
+        "SMTP_STARTTLS": "0",
+        "EMAIL_DEAD_LETTER_PATH": "",
+        "ADMIN_EMAIL": "admin@bench.local",
+    })
+    os.environ.pop("EMAIL_USER", None)
+
+    from storage import SQLiteStore, set_store
+
+    base = SQLiteStore(args.db or ":memory:")
+    if not args.db or base.get("serviceRequests") is None:
+        started = time.perf_counter()
+        ids = generate(base, args.bookings, args.clients, args.mechanics, args.seed)
+        print(f"Generated {args.bookings} bookings in {time.perf_counter() - started:.1f}s")
+    else:
+        ids = {role: list((base.query("users", "role", equal=role[:-1]) or {}))
+               for role in ("clients", "mechanics", "admins")}
+    store = LatencyStore(base, args.latency_ms, args.jitter_ms)
+    set_store(store)
+
+    import app as app_module
+    flask_app = app_module.create_app({"TESTING": True})
+    return app_module, flask_app, ids, sink, store
+
+
+def make_request(app_module, client, route, ids, rng):
+    hashes = app_module.HASHES
+    if route == "book_service":
+        day = datetime.now() + timedelta(days=rng.randint(1, 60))
+        return client.post("/book_service", data={
+            "address": "1 Bench Street", "vehicle": "BENCH", "make_model": "Bench 2020",
+            "category": rng.choice(("Heavy", "Light")), "service_date": day.strftime("%Y-%m-%d"),
+            "service_time": f"{rng.randint(8, 15):02d}:00", "description": "Benchmark booking",
+            "lat": "-25.75", "lng": "28.23",
+        })
+    if route == "assign_mechanic":
+        from bookings import page_bookings
+        page, _ = page_bookings(status="pending", limit=20)
+        booking_id = rng.choice(list(page)) if page else "missing"
+        return client.post(hashes["assign_mechanic"], data={
+            "booking_id": booking_id, "mechanic_id": rng.choice(ids["mechanics"]), "allow_overlap": "1",
+        })
+    return client.get(hashes[route])
+
+
+ROLE_FOR_ROUTE = {
+    "book_service": "clients",
+    "assign_mechanic": "admins",
+    "client_dashboard": "clients",
+    "mechanic_dashboard": "mechanics",
+    "admin_dashboard": "admins",
+}
+
+
+def bench_route(app_module, flask_app, route, ids, args):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    per_worker = max(1, args.requests // args.concurrency)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = flask_app.test_client()
+        user_id = rng.choice(ids[ROLE_FOR_ROUTE[route]])
+        with client.session_transaction() as session:
+            session["_user_id"] = user_id
+            session["_fresh"] = True
+        for _ in range(per_worker):
+            started = time.perf_counter()
+            response = make_request(app_module, client, route, ids, rng)
+            # Read the whole body, streamed pages are only rendered while it is consumed
+            response.get_data()
+            response.close()
+            elapsed = (time.perf_counter() - started) * 1000.0
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code >= 400:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker, args=(args.seed + i,)) for i in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "throughput_rps": round(len(latencies) / wall, 1) if wall else 0.0,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of routes whose p95 regressed past the tolerance."""
+    regressions = []
+    for route, stats in results.items():
+        old = baseline.get(route)
+        if old and stats["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {stats['p95_ms']}ms vs baseline {old['p95_ms']}ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the service request app")
+    parser.add_argument("--bookings", type=int, default=10000)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--mechanics", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added to every store call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--routes", default=",".join(ROUTES))
+    parser.add_argument("--db", help="reuse a dataset written by benchmarks.datasets")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", help="fail if p95 regresses against this file")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--save-baseline", help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    app_module, flask_app, ids, sink, store = setup(args)
+    results = {}
+    print(f"{'route':<20}{'reqs':>6}{'errs':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}")
+    for route in args.routes.split(","):
+        calls = store.calls
+        stats = bench_route(app_module, flask_app, route, ids, args)
+        stats["store_calls_per_request"] = round((store.calls - calls) / max(stats["requests"], 1), 2)
+        results[route] = stats
+        print(f"{route:<20}{stats['requests']:>6}{stats['errors']:>6}{stats['p50_ms']:>10}"
+              f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['throughput_rps']:>9}")
+
+    app_module.get_notifier().flush(30)
+    print(f"Emails delivered to the sink: {sink.messages}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions))
+            return 1
+        print("No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+# Service requests repository.
+# Every booking carries a few composite index fields ("<value>|<service_datetime>|<key>")
+# declared with .indexOn in database.rules.json. Ordering by one of them gives a
+# filter and a date ordering in a single query, and because the push key is part of
+# the value it can be used as a keyset cursor for pagination.
+#
+# Reference numbers are unique: referenceIndex/<reference_number> holds the booking's
+# push key. It is claimed in a transaction before the booking is written, and written
+# again in the same multi-location update as the booking.
+
+import re
+import secrets
+import sys
+from collections import Counter
+import stats
+from storage import get_store, increment, push_key, scan
+
+OPEN_STATUSES = ("pending", "assigned")
+CLOSED_STATUSES = ("completed", "cancelled")
+
+# index field -> function returning the leading value for a booking
+INDEX_FIELDS = {
+    "idx_date": lambda booking: "all",
+    "idx_open": lambda booking: "open" if booking.get("status") in OPEN_STATUSES else "closed",
+    "idx_status": lambda booking: booking.get("status") or "",
+    "idx_category": lambda booking: booking.get("category") or "",
+    # Open jobs per mechanic, so a calendar can be checked without reading their history
+    "idx_mechanic": lambda booking: (booking.get("assigned_mechanic") or "")
+    if booking.get("status") in OPEN_STATUSES else "",
+}
+
+# Upper bound used to close a prefix range
+HIGH = "\uf8ff"
+
+# Stop scanning after this many rows when a secondary filter rejects most of them
+MAX_SCAN = 1000
+
+REFERENCE_PATTERN = re.compile(r"^REF-[0-9A-F]{10}$")
+REFERENCE_ATTEMPTS = 5
+
+
+def index_fields(key, booking):
+    """Index values for a booking, to be written together with it."""
+    when = booking.get("service_datetime") or ""
+    return {field: f"{value(booking)}|{when}|{key}" for field, value in INDEX_FIELDS.items()}
+
+
+def new_reference():
+    return "REF-" + secrets.token_hex(5).upper()
+
+
+def normalize_reference(reference_number):
+    """Canonical form of a reference typed by a person, or None if it cannot be one."""
+    reference_number = (reference_number or "").strip().upper()
+    return reference_number if REFERENCE_PATTERN.match(reference_number) else None
+
+
+def create_booking(booking):
+    """Store a new booking under a fresh, unique reference number. Returns (key, reference_number)."""
+    store = get_store()
+    key = push_key()
+    for _ in range(REFERENCE_ATTEMPTS):
+        reference_number = new_reference()
+        if store.claim(f"referenceIndex/{reference_number}", key):
+            break
+    else:
+        raise RuntimeError("Could not allocate a unique reference number")
+    booking = dict(booking, reference_number=reference_number)
+    booking.update(index_fields(key, booking))
+    updates = {
+        f"serviceRequests/{key}": booking,
+        f"referenceIndex/{reference_number}": key,
+    }
+    updates.update(stats.deltas(None, booking))
+    try:
+        store.update("", updates)
+    except Exception:
+        # Give the reference back so the index never points at a missing booking
+        store.set(f"referenceIndex/{reference_number}", None)
+        raise
+    return key, reference_number
+
+
+def get_booking(key):
+    return get_store().get(f"serviceRequests/{key}")
+
+
+def update_booking(key, changes, booking=None):
+    """Apply changes to a booking, keeping its index fields in step. Returns the updated booking."""
+    if booking is None:
+        booking = get_booking(key)
+    if not booking:
+        raise ValueError("Booking not found")
+    before = booking
+    booking = dict(booking, **changes)
+    changes = dict(changes, **index_fields(key, booking))
+    updates = {f"serviceRequests/{key}/{field}": value for field, value in changes.items()}
+    # Counters change in the same write as the booking
+    updates.update(stats.deltas(before, booking))
+    get_store().update("", updates)
+    booking.update(changes)
+    return booking
+
+
+def get_bookings(keys):
+    """Fetch several bookings at once. Returns {key: booking} for the ones that exist."""
+    found = get_store().get_many(f"serviceRequests/{key}" for key in keys)
+    return {path.split("/", 1)[1]: booking for path, booking in found.items() if booking}
+
+
+def update_bookings(changes_by_key, bookings):
+    """Apply changes to many bookings in one multi-location update. Returns the updated bookings."""
+    updates = {}
+    updated = {}
+    counters = Counter()
+    for key, changes in changes_by_key.items():
+        booking = dict(bookings[key], **changes)
+        for field, value in dict(changes, **index_fields(key, booking)).items():
+            updates[f"serviceRequests/{key}/{field}"] = value
+        counters.update(stats.changes(bookings[key], booking))
+        updated[key] = booking
+    updates.update({path: increment(amount) for path, amount in counters.items() if amount})
+    get_store().update("", updates)
+    for key, booking in updated.items():
+        booking.update(index_fields(key, booking))
+    return updated
+
+
+def bookings_by_client(client_id):
+    return get_store().query("serviceRequests", "client_id", equal=client_id)
+
+
+def bookings_by_mechanic(mechanic_id):
+    return get_store().query("serviceRequests", "assigned_mechanic", equal=mechanic_id)
+
+
+def open_jobs(mechanic_id, date_from, date_to):
+    """A mechanic's pending or assigned bookings with service_datetime in [date_from, date_to]."""
+    return get_store().query("serviceRequests", "idx_mechanic",
+                             start=f"{mechanic_id}|{date_from}", end=f"{mechanic_id}|{date_to}{HIGH}")
+
+
+def bookings_by_status(status):
+    return get_store().query("serviceRequests", "status", equal=status)
+
+
+def booking_by_reference(reference_number):
+    """Return (key, booking) for a reference number, or (None, None)."""
+    store = get_store()
+    key = store.get(f"referenceIndex/{reference_number}")
+    if key:
+        booking = get_booking(key)
+        return (key, booking) if booking else (None, None)
+    # Bookings made before referenceIndex existed, until `reindex` has been run
+    found = store.query("serviceRequests", "reference_number", equal=reference_number, limit=1)
+    for key, booking in found.items():
+        return key, booking
+    return None, None
+
+
+def _query_plan(status, category):
+    # Pick the most selective index; the remaining filter is applied while scanning
+    if status == "open":
+        return "idx_open", "open", category
+    if status:
+        return "idx_status", status, category
+    if category:
+        return "idx_category", category, None
+    return "idx_date", "all", None
+
+
+def page_bookings(status="open", category=None, date_from=None, date_to=None, cursor=None, limit=50):
+    """Return (bookings, next_cursor) for one page of the admin list.
+
+    status is "open" (pending or assigned), a single status, or None for all bookings.
+    date_from / date_to are "YYYY-MM-DD" strings and bound service_datetime.
+    """
+    field, prefix, category_filter = _query_plan(status, category)
+    start = f"{prefix}|{date_from or ''}"
+    end = f"{prefix}|{date_to}{HIGH}" if date_to else f"{prefix}|{HIGH}"
+    if cursor and cursor > start:
+        start = cursor
+
+    page = {}
+    scanned = 0
+    last_seen = None
+    more = True
+    while more and len(page) <= limit and scanned < MAX_SCAN:
+        batch = get_store().query("serviceRequests", field, start=start, end=end, limit=limit + 2)
+        rows = [(key, booking) for key, booking in batch.items() if booking.get(field) != cursor]
+        for key, booking in rows:
+            scanned += 1
+            last_seen = booking.get(field)
+            if category_filter and booking.get("category") != category_filter:
+                continue
+            page[key] = booking
+            if len(page) > limit:
+                break
+        # A short batch means the range is exhausted
+        more = len(batch) >= limit + 2
+        if more:
+            cursor = start = list(batch.values())[-1].get(field)
+
+    next_cursor = None
+    if len(page) > limit:
+        # The extra row only tells us there is another page
+        last_key = list(page)[-1]
+        page.pop(last_key)
+        next_cursor = page[list(page)[-1]][field] if page else None
+    elif more and scanned >= MAX_SCAN:
+        # Scan budget used up before the end of the range, continue after the last row looked at
+        next_cursor = last_seen
+    return page, next_cursor
+
+
+def reindex_bookings(batch_size=500):
+    """Add index fields and referenceIndex entries to bookings written before they existed."""
+    store = get_store()
+    count = 0
+    for batch in scan("serviceRequests", batch_size):
+        updates = {}
+        for key, booking in batch.items():
+            for field, value in index_fields(key, booking).items():
+                updates[f"serviceRequests/{key}/{field}"] = value
+            if booking.get("reference_number"):
+                updates[f"referenceIndex/{booking['reference_number']}"] = key
+        store.update("", updates)
+        count += len(batch)
+        print(f"Reindexed {count} bookings")
+    return count
+
+
+# Usage: python bookings.py reindex
+if __name__ == "__main__":
+    if sys.argv[1:] != ["reindex"]:
+        sys.exit("Usage: python bookings.py reindex")
+    from dotenv import load_dotenv
+    load_dotenv()
+    reindex_bookings()
@@ -0,0 +1,159 @@
+# Live booking updates for the dashboards.
+# One upstream subscription per process (a Firebase stream, or the SQLite change
+# log) feeds every connected browser. Each Server-Sent Events connection registers a
+# subscriber with a filter, so clients and mechanics only receive their own bookings.
+#
+# Under gunicorn's threaded workers every open stream holds a thread, so a worker
+# accepts at most EVENTS_MAX_STREAMS of them and ends each one after
+# EVENTS_STREAM_SECONDS; the rest of its threads stay free for ordinary requests.
+# The browser reconnects by itself and sends the id of the last event it got, and
+# the changes it missed meanwhile are replayed from a short in-memory history.
+
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from storage import get_store
+
+HEARTBEAT_SECONDS = 15
+SUBSCRIBER_QUEUE_SIZE = 100
+MAX_STREAMS = int(os.getenv("EVENTS_MAX_STREAMS", "4"))
+STREAM_SECONDS = int(os.getenv("EVENTS_STREAM_SECONDS", "120"))
+RETRY_MS = 5000
+# Changes kept for browsers that reconnect
+HISTORY_SIZE = 1000
+# Workers see the same change at slightly different times; replay a little more
+REPLAY_MARGIN = 5.0
+
+# Fields sent to the browser; contact details stay on the server
+PUBLIC_FIELDS = ("reference_number", "name", "surname", "vehicle", "address", "description",
+                 "category", "service_datetime", "status", "assigned_mechanic", "phone")
+
+
+def booking_filter(role, user_id):
+    if role == "admin":
+        return lambda booking: True
+    if role == "client":
+        return lambda booking: booking.get("client_id") == user_id
+    if role == "mechanic":
+        return lambda booking: booking.get("assigned_mechanic") == user_id
+    return lambda booking: False
+
+
+class Subscriber:
+    def __init__(self, accept):
+        self.accept = accept
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.lagging = False
+
+
+class ChangeFeed:
+    def __init__(self, path="serviceRequests", max_streams=MAX_STREAMS):
+        self.path = path
+        self.max_streams = max_streams
+        self.after_fork()
+
+    def after_fork(self):
+        # The upstream stream and the browsers belong to the parent process
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._listener = None
+        self._history = deque(maxlen=HISTORY_SIZE)
+        self._since = None
+
+    def _start(self):
+        # Called with the lock held; the upstream stream is only opened once somebody listens
+        if self._listener is None:
+            self._since = time.time()
+            self._listener = get_store().listen(self.path, self.publish)
+
+    def subscribe(self, accept, last_event_id=None):
+        """Register a stream, or return None when this process already serves max_streams.
+
+        last_event_id is the id of the last event the browser received; the changes
+        since then are queued first, or a reload is asked for if they are not known.
+        """
+        subscriber = Subscriber(accept)
+        with self._lock:
+            if len(self._subscribers) >= self.max_streams:
+                return None
+            self._start()
+            if last_event_id:
+                self._replay(subscriber, last_event_id)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def _replay(self, subscriber, last_event_id):
+        try:
+            last = float(last_event_id)
+        except ValueError:
+            subscriber.lagging = True
+            return
+        known_from = self._history[0][0] if len(self._history) == self._history.maxlen else self._since
+        if last < known_from:
+            subscriber.lagging = True
+            return
+        since = last - REPLAY_MARGIN
+        for at, key, booking, previous in self._history:
+            if at > since:
+                self._deliver(subscriber, at, key, booking, previous)
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, key, booking, previous=None):
+        """Pass a change to every subscriber that may see the new or the previous version."""
+        with self._lock:
+            at = time.time()
+            self._history.append((at, key, booking, previous))
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            self._deliver(subscriber, at, key, booking, previous)
+
+    @staticmethod
+    def _deliver(subscriber, at, key, booking, previous):
+        # A subscriber that could see the booking before but not any more (it was
+        # deleted, archived or reassigned) is told it is gone, without its contents
+        sees_now = booking is not None and subscriber.accept(booking)
+        saw_before = previous is not None and subscriber.accept(previous)
+        if not sees_now and not saw_before:
+            return
+        try:
+            subscriber.queue.put_nowait((at, key, booking if sees_now else None))
+        except queue.Full:
+            # A slow browser only needs to know it should reload
+            subscriber.lagging = True
+
+    def stream(self, subscriber, describe=None):
+        """Yield SSE messages for a subscriber until the client disconnects or
+        STREAM_SECONDS have passed; the browser then reconnects by itself."""
+        try:
+            yield f"retry: {RETRY_MS}\nevent: ready\nid: {time.time():.3f}\ndata: {{}}\n\n"
+            deadline = time.monotonic() + STREAM_SECONDS
+            while True:
+                if subscriber.lagging:
+                    subscriber.lagging = False
+                    yield "event: reload\ndata: {}\n\n"
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    at, key, booking = subscriber.queue.get(timeout=min(HEARTBEAT_SECONDS, remaining))
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+                payload = {"key": key, "deleted": booking is None}
+                if booking is not None:
+                    payload.update({field: booking.get(field) for field in PUBLIC_FIELDS})
+                    if describe:
+                        payload.update(describe(booking))
+                yield f"event: booking\nid: {at:.3f}\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+
+feed = ChangeFeed()
+os.register_at_fork(after_in_child=feed.after_fork)
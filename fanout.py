@@ -0,0 +1,74 @@
+# Concurrent backend calls within one request.
+# A handler that needs several independent reads (a query, a profile, the mechanic
+# directory) passes them to gather(), which runs them on a shared thread pool and
+# returns when the slowest one is done. Calls keep the request context, so metrics
+# and current_user work as usual inside them. The Firebase client reuses its
+# keep-alive HTTP connections across these threads.
+
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", "16"))
+FANOUT_TIMEOUT = float(os.getenv("FANOUT_TIMEOUT", "10"))
+
+
+class FanoutTimeout(Exception):
+    pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="fanout",
+                                       initializer=_mark_worker)
+    return _pool
+
+
+def _mark_worker():
+    _local.worker = True
+
+
+def _forget_pool():
+    # Pool threads do not survive a fork; the child starts its own
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_pool)
+
+
+def gather(*calls, timeout=None):
+    """Run zero-argument callables concurrently and return their results in order.
+
+    Re-raises the first error, and raises FanoutTimeout when the calls are not all
+    done within timeout seconds (FANOUT_TIMEOUT by default).
+    """
+    timeout = FANOUT_TIMEOUT if timeout is None else timeout
+    if len(calls) < 2 or getattr(_local, "worker", False):
+        # Nothing to overlap, or already on a pool thread: a nested fan-out could
+        # wait on threads that are all busy waiting for it
+        return [call() for call in calls]
+    pool = _get_pool()
+    # Each call gets its own copy of the context (request, g, current_user)
+    futures = [pool.submit(contextvars.copy_context().run, call) for call in calls]
+    done, pending = wait(futures, timeout=timeout, return_when=FIRST_EXCEPTION)
+    for future in futures:
+        if future in done and future.exception() is not None:
+            for other in pending:
+                other.cancel()
+            raise future.exception()
+    if pending:
+        for future in pending:
+            future.cancel()
+        names = ", ".join(getattr(calls[futures.index(f)], "__name__", "call") for f in pending)
+        raise FanoutTimeout(f"{names} did not finish within {timeout}s")
+    return [future.result() for future in futures]
@@ -0,0 +1,190 @@
+# Nearest-mechanic suggestions.
+# Mechanic positions (last reported location, or their base when the report is stale)
+# are kept in an in-process grid index: points are bucketed into cells of
+# CELL_DEGREES and a lookup only visits the rings of cells around the booking.
+
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from storage import get_store
+from users import get_mechanics
+
+CELL_DEGREES = float(os.getenv("GEO_CELL_DEGREES", "0.05"))
+LOCATION_MAX_AGE = timedelta(hours=float(os.getenv("LOCATION_MAX_AGE_HOURS", "12")))
+GEO_INDEX_TTL = int(os.getenv("GEO_INDEX_TTL", "300"))
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.0
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def parse_coordinates(lat, lng):
+    """Return (lat, lng) as floats, or (None, None) if missing or out of range."""
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        return None, None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None, None
+    return lat, lng
+
+
+class GridIndex:
+    def __init__(self, cell_degrees=CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._cells = {}
+        self._points = {}
+        # Extent of the occupied cells, bounds how far a lookup has to walk
+        self._rows = self._cols = None
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_degrees)), int(math.floor(lng / self.cell_degrees))
+
+    def add(self, item_id, lat, lng):
+        self.remove(item_id)
+        cell = self._cell(lat, lng)
+        self._points[item_id] = (lat, lng, cell)
+        self._cells.setdefault(cell, set()).add(item_id)
+        if self._rows is None:
+            self._rows, self._cols = [cell[0], cell[0]], [cell[1], cell[1]]
+        else:
+            self._rows = [min(self._rows[0], cell[0]), max(self._rows[1], cell[0])]
+            self._cols = [min(self._cols[0], cell[1]), max(self._cols[1], cell[1])]
+
+    def remove(self, item_id):
+        point = self._points.pop(item_id, None)
+        if point:
+            bucket = self._cells.get(point[2])
+            bucket.discard(item_id)
+            if not bucket:
+                del self._cells[point[2]]
+
+    def __len__(self):
+        return len(self._points)
+
+    @staticmethod
+    def _ring(row, col, ring):
+        if ring == 0:
+            yield row, col
+            return
+        for c in range(col - ring, col + ring + 1):
+            yield row - ring, c
+            yield row + ring, c
+        for r in range(row - ring + 1, row + ring):
+            yield r, col - ring
+            yield r, col + ring
+
+    def nearest(self, lat, lng, k=5, accept=None):
+        """Return [(distance_km, item_id)] for the k closest accepted items."""
+        if not self._points:
+            return []
+        row, col = self._cell(lat, lng)
+        # Cells are narrower in km away from the equator; use the narrow side for the bound
+        cell_km = self.cell_degrees * KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)
+        max_ring = max(abs(row - self._rows[0]), abs(row - self._rows[1]),
+                       abs(col - self._cols[0]), abs(col - self._cols[1]))
+        found = []
+        probed = visited = 0
+        for ring in range(max_ring + 1):
+            if probed > len(self._cells):
+                # The rings now hold more empty cells than there are occupied ones
+                # (a sparse fleet, or fewer than k accepted): checking every point is cheaper
+                return self._scan(lat, lng, k, accept)
+            for cell in self._ring(row, col, ring):
+                probed += 1
+                for item_id in self._cells.get(cell, ()):
+                    visited += 1
+                    if accept and not accept(item_id):
+                        continue
+                    p_lat, p_lng, _ = self._points[item_id]
+                    found.append((haversine_km(lat, lng, p_lat, p_lng), item_id))
+            if visited == len(self._points):
+                break
+            # Anything outside this ring is at least ring * cell_km away
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] <= ring * cell_km:
+                    break
+        found.sort()
+        return found[:k]
+
+    def _scan(self, lat, lng, k, accept):
+        found = [(haversine_km(lat, lng, p_lat, p_lng), item_id)
+                 for item_id, (p_lat, p_lng, _) in self._points.items()
+                 if not accept or accept(item_id)]
+        found.sort()
+        return found[:k]
+
+
+def mechanic_position(location, now=None):
+    """Last reported position if recent enough, otherwise the mechanic's base."""
+    now = now or datetime.now()
+    lat, lng = parse_coordinates(location.get("lat"), location.get("lng"))
+    reported = location.get("updated_at")
+    if lat is not None and reported and now - datetime.fromisoformat(reported) <= LOCATION_MAX_AGE:
+        return lat, lng
+    return parse_coordinates(location.get("base_lat"), location.get("base_lng"))
+
+
+_index = None
+_index_built = 0.0
+_locations = {}
+_index_lock = threading.Lock()
+
+
+def _mechanic_index():
+    global _index, _index_built, _locations
+    with _index_lock:
+        if _index is None or time.monotonic() - _index_built > GEO_INDEX_TTL:
+            locations = get_store().get("mechanicLocations") or {}
+            index = GridIndex()
+            for uid, location in locations.items():
+                lat, lng = mechanic_position(location)
+                if lat is not None:
+                    index.add(uid, lat, lng)
+            _index, _locations, _index_built = index, dict(locations), time.monotonic()
+        return _index
+
+
+def update_mechanic_location(uid, changes):
+    """Store new location fields (lat/lng/updated_at, base_lat/base_lng, available) for a mechanic."""
+    get_store().update(f"mechanicLocations/{uid}", changes)
+    index = _mechanic_index()
+    with _index_lock:
+        location = dict(_locations.get(uid) or {}, **changes)
+        _locations[uid] = location
+        lat, lng = mechanic_position(location)
+        if lat is None:
+            index.remove(uid)
+        else:
+            index.add(uid, lat, lng)
+
+
+def mechanic_coordinates(uid):
+    """(lat, lng) the mechanic is at or starts from, or (None, None) if unknown."""
+    _mechanic_index()
+    with _index_lock:
+        location = _locations.get(uid)
+    return mechanic_position(location) if location else (None, None)
+
+
+def nearest_mechanics(lat, lng, k=5):
+    """Closest available mechanics as [{uid, name, surname, phone, distance_km}]."""
+    index = _mechanic_index()
+    mechanics = get_mechanics()
+
+    def available(uid):
+        return uid in mechanics and _locations.get(uid, {}).get("available", True)
+
+    with _index_lock:
+        found = index.nearest(lat, lng, k, accept=available)
+    return [
+        dict(uid=uid, distance_km=round(distance, 2), **mechanics[uid])
+        for distance, uid in found
+    ]
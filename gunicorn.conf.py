@@ -0,0 +1,22 @@
+# gunicorn -c gunicorn.conf.py wsgi:app
+# The app is imported once in the master and forked into the workers, so a worker
+# starts in milliseconds. Connections are never opened in the master: each worker
+# opens its own Firebase app and SMTP sessions in post_fork, before taking traffic.
+
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+# Threads per worker. A live dashboard holds one for as long as its stream is open,
+# so at most half of them serve streams and the rest stay free for other requests.
+# With an async worker (GUNICORN_WORKER_CLASS=gevent) raise EVENTS_MAX_STREAMS instead.
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+os.environ.setdefault("EVENTS_MAX_STREAMS", str(max(1, threads // 2)))
+timeout = 60
+preload_app = True
+
+
+def post_fork(server, worker):
+    from app import warm_up
+    warm_up()
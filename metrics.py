@@ -0,0 +1,179 @@
+# Request timing and Prometheus-style metrics.
+# Every store call (database reads/writes and Auth calls), template render and SMTP
+# send is timed and labelled by operation and route. Route latency goes into a
+# histogram, and the time spent per phase is kept on the request so slow requests
+# can be logged with a breakdown (SLOW_REQUEST_MS, off by default).
+
+import os
+import threading
+import time
+from flask import g, has_request_context, request
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Store methods that go to Firebase Auth rather than the database
+AUTH_CALLS = ("create_account", "find_account", "delete_account")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value).replace(chr(34), chr(39))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, values)} {total}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += seconds
+            series[2] += 1
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labels + ("le",), values + (bound,))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels + ("le",), values + ("+Inf",))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labels, values)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+request_duration = Histogram("http_request_duration_seconds", "Route latency", ("route", "method"))
+requests_total = Counter("http_requests_total", "Requests handled", ("route", "method", "status"))
+call_duration = Histogram("backend_call_duration_seconds", "Database, Auth, render and SMTP calls",
+                          ("kind", "operation", "route"))
+call_errors = Counter("backend_call_errors_total", "Failed backend calls", ("kind", "operation", "route"))
+slow_requests = Counter("http_slow_requests_total", "Requests slower than SLOW_REQUEST_MS", ("route",))
+
+REGISTRY = (request_duration, requests_total, call_duration, call_errors, slow_requests)
+
+
+def current_route():
+    if has_request_context():
+        return request.endpoint or "unknown"
+    return "background"
+
+
+def record_call(kind, operation, seconds, ok=True):
+    route = current_route()
+    call_duration.observe(seconds, kind, operation, route)
+    if not ok:
+        call_errors.inc(kind, operation, route)
+    if has_request_context():
+        phases = g.setdefault("phases", {})
+        phases[kind] = phases.get(kind, 0.0) + seconds
+
+
+# Wraps a store from storage.py and times every call
+class InstrumentedStore:
+    CALLS = ("get", "get_many", "set", "update", "claim", "query", "create_account", "find_account",
+             "delete_account")
+
+    def __init__(self, store):
+        self._store = store
+
+    def __getattr__(self, name):
+        attr = getattr(self._store, name)
+        if name not in self.CALLS:
+            return attr
+        kind = "auth" if name in AUTH_CALLS else "db"
+
+        def call(*args, **kwargs):
+            started = time.perf_counter()
+            ok = False
+            try:
+                result = attr(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                record_call(kind, name, time.perf_counter() - started, ok)
+        return call
+
+
+def init_app(app):
+    """Time routes and template rendering, and log slow requests when enabled."""
+    from flask import before_render_template, template_rendered
+
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+        g.phases = {}
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop("request_started", None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        route = request.endpoint or "unknown"
+        request_duration.observe(elapsed, route, request.method)
+        requests_total.inc(route, request.method, response.status_code)
+        if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+            slow_requests.inc(route)
+            phases = g.get("phases", {})
+            other = elapsed - sum(phases.values())
+            breakdown = " ".join(f"{kind}={seconds * 1000:.1f}ms" for kind, seconds in sorted(phases.items()))
+            print(f"Slow request {request.method} {request.path} ({route}) {elapsed * 1000:.1f}ms: "
+                  f"{breakdown} other={other * 1000:.1f}ms")
+        return response
+
+    def _render_started(sender, template, context, **extra):
+        g.render_started = time.perf_counter()
+
+    def _render_finished(sender, template, context, **extra):
+        started = g.pop("render_started", None)
+        if started is not None:
+            record_call("render", template.name or "template", time.perf_counter() - started)
+
+    before_render_template.connect(_render_started, app, weak=False)
+    template_rendered.connect(_render_finished, app, weak=False)
+
+
+def expose():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,247 @@
+# Background email notifications.
+# Messages are put on a queue and sent by worker threads, so a request never
+# waits for the mail server. Every worker keeps its own authenticated SMTP
+# session open and reuses it for the following messages.
+
+import json
+import queue
+import smtplib
+import threading
+import time
+from datetime import datetime
+from email.mime.text import MIMEText
+
+
+# Opens authenticated SMTP sessions. Any object with a connect() method that
+# returns something with send_message(), noop() and quit() can be used instead,
+# e.g. SMTPTransport("localhost", 1025, starttls=False) for a local test server.
+class SMTPTransport:
+    def __init__(self, host, port, user=None, password=None, starttls=True, timeout=30):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.user:
+                server.login(self.user, self.password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+
+# A long-lived session owned by a single worker thread
+class PooledConnection:
+    def __init__(self, transport, idle_timeout):
+        self.transport = transport
+        self.idle_timeout = idle_timeout
+        self.server = None
+        self.last_used = 0.0
+
+    def send(self, msg):
+        if self.server is not None and time.monotonic() - self.last_used > self.idle_timeout:
+            # The server has probably dropped an idle session, check before reusing it
+            try:
+                self.server.noop()
+            except Exception:
+                self.close()
+        if self.server is None:
+            self.server = self.transport.connect()
+        self.server.send_message(msg)
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+
+class Notifier:
+    def __init__(self, transport, sender, workers=2, max_retries=3, backoff=2.0,
+                 idle_timeout=60.0, dead_letter_path=None, on_send=None):
+        self.transport = transport
+        self.sender = sender
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.dead_letter_path = dead_letter_path
+        # Called with (seconds, ok) after every delivery attempt, e.g. for metrics
+        self.on_send = on_send
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stopping = False
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping = False
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"notifier-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def send(self, to, subject, body):
+        """Queue an email and return immediately."""
+        if not to:
+            return
+        self.start()
+        self._queue.put({"to": to, "subject": subject, "body": body})
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far has been sent or dead-lettered."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stop(self, timeout=10):
+        self.flush(timeout)
+        with self._lock:
+            self._stopping = True
+            for _ in self._threads:
+                self._queue.put(None)
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+
+    def _build_message(self, item):
+        msg = MIMEText(item["body"])
+        msg["Subject"] = item["subject"]
+        msg["From"] = self.sender
+        msg["To"] = item["to"]
+        return msg
+
+    def _work(self):
+        conn = PooledConnection(self.transport, self.idle_timeout)
+        while True:
+            try:
+                item = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                # Nothing to send for a while, release the session
+                conn.close()
+                continue
+            if item is None:
+                conn.close()
+                self._queue.task_done()
+                return
+            try:
+                self._deliver(conn, item)
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, conn, item):
+        msg = self._build_message(item)
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                conn.send(msg)
+                self._sent(started, True)
+                return
+            except Exception as e:
+                self._sent(started, False)
+                # Drop the session, it may be in a broken state
+                conn.close()
+                error = e
+                if attempt < self.max_retries and not self._stopping:
+                    time.sleep(self.backoff * (2 ** attempt))
+        print(f"Failed to send email to {item['to']}: {error}")
+        self._dead_letter(item, error)
+
+    def _sent(self, started, ok):
+        if self.on_send:
+            self.on_send(time.perf_counter() - started, ok)
+
+    def _dead_letter(self, item, error):
+        if not self.dead_letter_path:
+            return
+        record = dict(item, error=str(error), failed_at=datetime.now().isoformat())
+        with self._lock:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+
+# Collects messages per recipient and sends them as one summary email, once
+# max_items have been collected or interval seconds after the first one, whichever
+# comes first. Everything still pending is sent by stop().
+class Digest:
+    def __init__(self, notifier, subject, interval=900, max_items=20):
+        self.notifier = notifier
+        # May contain {count}
+        self.subject = subject
+        self.interval = interval
+        self.max_items = max_items
+        self._pending = {}  # recipient -> (monotonic time of the first item, [texts])
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopping = False
+
+    def add(self, to, text):
+        if not to:
+            return
+        with self._lock:
+            new = to not in self._pending
+            first, items = self._pending.setdefault(to, (time.monotonic(), []))
+            items.append(text)
+            full = len(items) >= self.max_items
+            if full:
+                del self._pending[to]
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="digest", daemon=True)
+                self._thread.start()
+        if full:
+            self._send(to, items)
+        elif new:
+            # Let the thread work out its next deadline with this recipient included
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return {to: len(items) for to, (_, items) in self._pending.items()}
+
+    def flush(self, due_only=False):
+        """Send the collected messages; with due_only, only those older than the interval."""
+        now = time.monotonic()
+        with self._lock:
+            ready = {to: items for to, (first, items) in self._pending.items()
+                     if not due_only or now - first >= self.interval}
+            for to in ready:
+                del self._pending[to]
+        for to, items in ready.items():
+            self._send(to, items)
+
+    def stop(self, timeout=10):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def _run(self):
+        while not self._stopping:
+            with self._lock:
+                firsts = [first for first, _ in self._pending.values()]
+            # Sleep until the oldest pending item is due
+            wait = min(firsts) + self.interval - time.monotonic() if firsts else self.interval
+            self._wake.wait(max(wait, 0.05))
+            self._wake.clear()
+            self.flush(due_only=True)
+
+    def _send(self, to, items):
+        separator = "\n\n" + "-" * 40 + "\n\n"
+        self.notifier.send(to, self.subject.format(count=len(items)), separator.join(items))
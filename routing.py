@@ -0,0 +1,199 @@
+# Daily route planning for mechanics.
+# A mechanic's jobs for one day are ordered with a nearest-neighbour tour that is
+# then improved with 2-opt. Every job has a time window starting at its service_datetime;
+# arriving early means waiting, arriving late is penalised heavily, so the planner
+# only trades punctuality for distance when it has to. Travel estimates come from the
+# straight-line distance with a road factor, and are cached per pair of points.
+
+import os
+from datetime import datetime, timedelta
+from bookings import CLOSED_STATUSES, bookings_by_mechanic
+from cache import TTLCache
+from geo import haversine_km, mechanic_coordinates, parse_coordinates
+from scheduling import DATETIME_FORMAT, WORKDAY_START, job_interval
+
+ROAD_FACTOR = float(os.getenv("ROUTE_ROAD_FACTOR", "1.3"))
+AVERAGE_SPEED_KMH = float(os.getenv("ROUTE_SPEED_KMH", "40"))
+# A job starts at its service_datetime at the earliest, and up to this many minutes later
+WINDOW_MINUTES = int(os.getenv("ROUTE_WINDOW_MINUTES", "60"))
+# Cost of one minute late, in km of extra driving
+LATE_PENALTY_KM = 5.0
+MAX_2OPT_ROUNDS = 50
+ROUTE_CACHE_TTL = int(os.getenv("ROUTE_CACHE_TTL", "120"))
+
+distance_cache = TTLCache(maxsize=100000, ttl=24 * 3600)
+route_cache = TTLCache(maxsize=1024, ttl=ROUTE_CACHE_TTL)
+
+
+def road_km(a, b):
+    """Estimated road distance between two (lat, lng) points."""
+    if a == b:
+        return 0.0
+    pair = (a, b) if a < b else (b, a)
+    km = distance_cache.get(pair)
+    if km is None:
+        km = haversine_km(*a, *b) * ROAD_FACTOR
+        distance_cache.set(pair, km)
+    return km
+
+
+def travel_time(km):
+    return timedelta(hours=km / AVERAGE_SPEED_KMH)
+
+
+class Job:
+    def __init__(self, key, booking, point, interval):
+        self.key = key
+        self.booking = booking
+        self.point = point
+        self.start, self.end = interval
+        self.duration = self.end - self.start
+        self.window_open = self.start
+        self.window_close = self.start + timedelta(minutes=WINDOW_MINUTES)
+
+
+def simulate(order, origin, depart, matrix):
+    """Walk a route. Returns (cost, distance_km, late_minutes, stops)."""
+    here, now = origin, depart
+    distance = late = 0.0
+    stops = []
+    for job in order:
+        km = matrix[here][job.point] if here is not None else 0.0
+        arrival = now + travel_time(km)
+        begin = max(arrival, job.window_open)
+        late_by = max(0.0, (begin - job.window_close).total_seconds() / 60)
+        stops.append((job, km, arrival, begin, late_by))
+        distance += km
+        late += late_by
+        here, now = job.point, begin + job.duration
+    return distance + LATE_PENALTY_KM * late, distance, late, stops
+
+
+def nearest_neighbour(jobs, origin, depart, matrix):
+    """Greedy tour: always go to the job that can be started soonest, lateness counted heavily."""
+    remaining = list(jobs)
+    order = []
+    here, now = origin, depart
+    while remaining:
+        def score(job):
+            km = matrix[here][job.point] if here is not None else 0.0
+            begin = max(now + travel_time(km), job.window_open)
+            late_by = max(0.0, (begin - job.window_close).total_seconds() / 60)
+            return begin + timedelta(minutes=LATE_PENALTY_KM * late_by), km
+        job = min(remaining, key=score)
+        remaining.remove(job)
+        order.append(job)
+        km = matrix[here][job.point] if here is not None else 0.0
+        now = max(now + travel_time(km), job.window_open) + job.duration
+        here = job.point
+    return order
+
+
+def two_opt(order, origin, depart, matrix):
+    """Reverse segments of the route while that lowers its cost."""
+    best = simulate(order, origin, depart, matrix)[0]
+    for _ in range(MAX_2OPT_ROUNDS):
+        improved = False
+        for i in range(len(order) - 1):
+            for j in range(i + 1, len(order)):
+                candidate = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                cost = simulate(candidate, origin, depart, matrix)[0]
+                if cost < best - 1e-9:
+                    order, best, improved = candidate, cost, True
+        if not improved:
+            break
+    return order
+
+
+def distance_matrix(points):
+    """Pairwise road distances as {a: {b: km}}, built from the pair cache."""
+    return {a: {b: road_km(a, b) for b in points} for a in points}
+
+
+def plan_route(jobs, origin=None, day=None):
+    """Visiting order for a day's jobs. origin is where the mechanic starts, or None."""
+    located = [job for job in jobs if job.point is not None]
+    unlocated = sorted((job for job in jobs if job.point is None), key=lambda job: job.start)
+    if not located:
+        return {"stops": [], "unlocated": unlocated, "distance_km": 0.0, "late_minutes": 0.0,
+                "scheduled_distance_km": 0.0}
+    day = day or located[0].start.date()
+    first = min(job.window_open for job in located)
+    # Leave at the start of the working day, or later if the first job is later
+    depart = max(datetime.combine(day, datetime.min.time()) + timedelta(hours=WORKDAY_START),
+                 first - timedelta(hours=1)) if origin else first
+    points = {job.point for job in located}
+    if origin:
+        points.add(origin)
+    matrix = distance_matrix(points)
+
+    # The order the jobs were booked in is the baseline the plan must beat
+    scheduled = sorted(located, key=lambda job: job.start)
+    candidates = [scheduled, nearest_neighbour(located, origin, depart, matrix)]
+    routes = [two_opt(order, origin, depart, matrix) for order in candidates]
+    cost, distance, late, stops = min((simulate(order, origin, depart, matrix) for order in routes),
+                                      key=lambda result: result[0])
+    return {
+        "stops": stops,
+        "unlocated": unlocated,
+        "distance_km": distance,
+        "late_minutes": late,
+        "scheduled_distance_km": simulate(scheduled, origin, depart, matrix)[1],
+    }
+
+
+def day_jobs(bookings, day):
+    jobs = []
+    for key, booking in bookings.items():
+        interval = job_interval(booking)
+        if not interval or interval[0].date() != day or booking.get("status") in CLOSED_STATUSES:
+            continue
+        lat, lng = parse_coordinates(booking.get("lat"), booking.get("lng"))
+        jobs.append(Job(key, booking, (lat, lng) if lat is not None else None, interval))
+    return jobs
+
+
+def mechanic_route(mechanic_id, day, bookings=None):
+    """The planned route of a mechanic for a day, as plain data for templates and JSON."""
+    if bookings is None:
+        bookings = bookings_by_mechanic(mechanic_id)
+    jobs = day_jobs(bookings, day)
+    lat, lng = mechanic_coordinates(mechanic_id)
+    origin = (lat, lng) if lat is not None else None
+    # Same jobs at the same times from the same start give the same plan
+    signature = (mechanic_id, day, origin,
+                 tuple(sorted((job.key, job.point, job.start, job.booking.get("category")) for job in jobs)))
+    route = route_cache.get(signature)
+    if route is None:
+        plan = plan_route(jobs, origin, day)
+        route = {
+            "date": day.isoformat(),
+            "start": {"lat": origin[0], "lng": origin[1]} if origin else None,
+            "distance_km": round(plan["distance_km"], 1),
+            "scheduled_distance_km": round(plan["scheduled_distance_km"], 1),
+            "late_minutes": round(plan["late_minutes"]),
+            "stops": [
+                {
+                    "key": job.key,
+                    "reference_number": job.booking.get("reference_number"),
+                    "address": job.booking.get("address"),
+                    "service_datetime": job.booking.get("service_datetime"),
+                    "arrive": arrival.strftime("%H:%M"),
+                    "start": begin.strftime("%H:%M"),
+                    "travel_km": round(km, 1),
+                    "late_minutes": round(late_by),
+                }
+                for job, km, arrival, begin, late_by in plan["stops"]
+            ],
+            "unlocated": [
+                {
+                    "key": job.key,
+                    "reference_number": job.booking.get("reference_number"),
+                    "address": job.booking.get("address"),
+                    "service_datetime": job.start.strftime(DATETIME_FORMAT),
+                }
+                for job in plan["unlocated"]
+            ],
+        }
+        route_cache.set(signature, route)
+    return route
@@ -0,0 +1,213 @@
+# Mechanic calendars.
+# Every mechanic gets a list of their assigned jobs as (start, end, booking key)
+# intervals sorted by start time. Because no job is longer than the longest
+# category duration, the jobs that can overlap a new interval are found with a
+# binary search instead of a scan, however many jobs a mechanic has.
+#
+# The calendars are kept per process, so before checking an assignment the target
+# mechanic's open jobs around that time are read again from the database (one
+# indexed range query): another worker may have given them a job since. Check and assignment of one mechanic run
+# under a lock, so two requests in the same process cannot both pass the check.
+
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from bookings import bookings_by_status, open_jobs
+from users import get_mechanics
+
+# Estimated time on site per category, in minutes
+CATEGORY_DURATIONS = {"Heavy": 180, "Light": 90}
+DEFAULT_DURATION = 120
+LONGEST_JOB = timedelta(minutes=max(DEFAULT_DURATION, *CATEGORY_DURATIONS.values()))
+
+WORKDAY_START = int(os.getenv("WORKDAY_START", "8"))
+WORKDAY_END = int(os.getenv("WORKDAY_END", "17"))
+SLOT_MINUTES = int(os.getenv("SLOT_MINUTES", "30"))
+SCHEDULE_TTL = int(os.getenv("SCHEDULE_TTL", "300"))
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M"
+
+
+def job_duration(category):
+    return timedelta(minutes=CATEGORY_DURATIONS.get(category, DEFAULT_DURATION))
+
+
+def job_interval(booking):
+    """(start, end) of a booking, or None if it has no valid service_datetime."""
+    try:
+        start = datetime.strptime(booking.get("service_datetime") or "", DATETIME_FORMAT)
+    except ValueError:
+        return None
+    return start, start + job_duration(booking.get("category"))
+
+
+class Calendar:
+    def __init__(self):
+        self._starts = []
+        self._jobs = []
+        self._by_key = {}
+        self._longest = timedelta(0)
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def add(self, start, end, key):
+        self.remove(key)
+        i = bisect.bisect_right(self._starts, start)
+        self._starts.insert(i, start)
+        self._jobs.insert(i, (start, end, key))
+        self._by_key[key] = start
+        self._longest = max(self._longest, end - start)
+
+    def remove(self, key):
+        start = self._by_key.pop(key, None)
+        if start is None:
+            return
+        i = bisect.bisect_left(self._starts, start)
+        while self._jobs[i][2] != key:
+            i += 1
+        del self._starts[i]
+        del self._jobs[i]
+
+    def starting(self, start, end):
+        """Jobs that start in [start, end]."""
+        lo = bisect.bisect_left(self._starts, start)
+        hi = bisect.bisect_right(self._starts, end)
+        return self._jobs[lo:hi]
+
+    def overlapping(self, start, end):
+        """Jobs that overlap [start, end)."""
+        lo = bisect.bisect_left(self._starts, start - self._longest)
+        hi = bisect.bisect_left(self._starts, end)
+        return [job for job in self._jobs[lo:hi] if job[1] > start]
+
+    def free_starts(self, day_start, day_end, duration, step):
+        """Start times in [day_start, day_end - duration] where a job of this length fits."""
+        busy = self.overlapping(day_start, day_end)
+        starts = []
+        t = day_start
+        while t + duration <= day_end:
+            clash = next((job for job in busy if job[0] < t + duration and job[1] > t), None)
+            if clash is None:
+                starts.append(t)
+                t += step
+            else:
+                # Jump past the clashing job, staying on the slot grid
+                skip = max(step, clash[1] - t)
+                t += step * -(-skip // step)
+        return starts
+
+
+class Schedule:
+    def __init__(self):
+        self._calendars = {}
+        self._owners = {}
+        self._loaded = 0.0
+        self._lock = threading.Lock()
+        self._mechanic_locks = {}
+
+    def _refresh(self):
+        if time.monotonic() - self._loaded <= SCHEDULE_TTL:
+            return
+        calendars = {}
+        owners = {}
+        for key, booking in bookings_by_status("assigned").items():
+            interval = job_interval(booking)
+            mechanic_id = booking.get("assigned_mechanic")
+            if interval and mechanic_id:
+                calendars.setdefault(mechanic_id, Calendar()).add(*interval, key)
+                owners[key] = mechanic_id
+        self._calendars = calendars
+        self._owners = owners
+        self._loaded = time.monotonic()
+
+    @contextmanager
+    def holding(self, *mechanic_ids):
+        """Keep other threads of this process from assigning jobs to these mechanics."""
+        with self._lock:
+            locks = [self._mechanic_locks.setdefault(m, threading.Lock())
+                     for m in sorted(set(filter(None, mechanic_ids)))]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def reload(self, mechanic_id, start, end):
+        """Replace the mechanic's jobs that could overlap [start, end) with their open
+        jobs for that window in the database."""
+        start -= LONGEST_JOB
+        jobs = {}
+        found = open_jobs(mechanic_id, start.strftime(DATETIME_FORMAT), end.strftime(DATETIME_FORMAT))
+        for key, booking in found.items():
+            interval = job_interval(booking)
+            if interval:
+                jobs[key] = interval
+        with self._lock:
+            self._refresh()
+            calendar = self._calendars.setdefault(mechanic_id, Calendar())
+            for _, _, key in calendar.starting(start, end):
+                calendar.remove(key)
+                if self._owners.get(key) == mechanic_id:
+                    del self._owners[key]
+            for key, interval in jobs.items():
+                previous = self._owners.get(key)
+                if previous in self._calendars and previous != mechanic_id:
+                    self._calendars[previous].remove(key)
+                calendar.add(*interval, key)
+                self._owners[key] = mechanic_id
+
+    def conflicts(self, mechanic_id, booking_key, booking, fresh=True):
+        """Other jobs of the mechanic that overlap this booking. With fresh, the
+        mechanic's jobs around it are read from the database first."""
+        interval = job_interval(booking)
+        if not interval:
+            return []
+        if fresh:
+            self.reload(mechanic_id, *interval)
+        with self._lock:
+            self._refresh()
+            calendar = self._calendars.get(mechanic_id)
+            jobs = calendar.overlapping(*interval) if calendar else []
+        return [job for job in jobs if job[2] != booking_key]
+
+    def assign(self, mechanic_id, booking_key, booking):
+        interval = job_interval(booking)
+        with self._lock:
+            self._refresh()
+            previous = self._owners.pop(booking_key, None)
+            if previous in self._calendars:
+                self._calendars[previous].remove(booking_key)
+            if interval:
+                self._calendars.setdefault(mechanic_id, Calendar()).add(*interval, booking_key)
+                self._owners[booking_key] = mechanic_id
+
+    def release(self, booking_key):
+        """Free the mechanic's time once a job is completed or cancelled."""
+        with self._lock:
+            previous = self._owners.pop(booking_key, None)
+            if previous in self._calendars:
+                self._calendars[previous].remove(booking_key)
+
+    def free_slots(self, day, category=None, now=None):
+        """Start times ("HH:MM") on day when at least one mechanic can take the job."""
+        now = now or datetime.now()
+        day_start = datetime.combine(day, datetime.min.time()) + timedelta(hours=WORKDAY_START)
+        day_end = datetime.combine(day, datetime.min.time()) + timedelta(hours=WORKDAY_END)
+        duration = job_duration(category)
+        step = timedelta(minutes=SLOT_MINUTES)
+        slots = set()
+        with self._lock:
+            self._refresh()
+            for mechanic_id in get_mechanics():
+                calendar = self._calendars.get(mechanic_id) or Calendar()
+                slots.update(calendar.free_starts(day_start, day_end, duration, step))
+        return [slot.strftime("%H:%M") for slot in sorted(slots) if slot >= now]
+
+
+schedule = Schedule()
@@ -0,0 +1,40 @@
+// Live booking updates pushed by the server (Server-Sent Events).
+// Rows carry data-key, cells data-field; unknown bookings show a refresh notice.
+// The server ends each stream after a while and the browser reconnects by itself;
+// when the server is full it refuses the stream, and we try again a bit later.
+function liveBookings(url, lastEventId) {
+    if (!window.EventSource) return;
+
+    function showNotice() {
+        const notice = document.getElementById("live-notice");
+        if (notice) notice.classList.remove("d-none");
+    }
+
+    const sep = url.indexOf("?") === -1 ? "?" : "&";
+    const source = new EventSource(lastEventId ? url + sep + "last_event_id=" + encodeURIComponent(lastEventId) : url);
+    source.addEventListener("ready", e => { lastEventId = e.lastEventId || lastEventId; });
+    source.addEventListener("error", () => {
+        if (source.readyState !== EventSource.CLOSED) return;
+        setTimeout(() => liveBookings(url, lastEventId), 20000 + Math.random() * 20000);
+    });
+    source.addEventListener("booking", e => {
+        lastEventId = e.lastEventId || lastEventId;
+        const data = JSON.parse(e.data);
+        const row = document.querySelector('tr[data-key="' + data.key + '"]');
+        if (!row) {
+            if (!data.deleted) showNotice();
+            return;
+        }
+        if (data.deleted) {
+            row.remove();
+            return;
+        }
+        row.querySelectorAll("[data-field]").forEach(cell => {
+            const value = data[cell.dataset.field];
+            if (value !== undefined && value !== null) cell.textContent = value;
+        });
+        row.classList.add("table-info");
+        setTimeout(() => row.classList.remove("table-info"), 2000);
+    });
+    source.addEventListener("reload", showNotice);
+}
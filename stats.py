@@ -0,0 +1,162 @@
+# Booking statistics, maintained incrementally.
+# Every booking write adds server-side increments for the counters it affects to
+# the same multi-location update, so reading the aggregates never touches
+# serviceRequests:
+#
+#   stats/summary                 {total, byStatus: {...}, byCategory: {...}}
+#   statsByDay/<yyyy-mm-dd>       {total, byStatus: {...}}            (by service date)
+#   statsByWeek/<yyyy-Www>        {total, byMechanic: {...}, byCategory: {...}}
+#
+# Usage: python stats.py rebuild   (recount everything from serviceRequests)
+#        python stats.py check     (report counters that drifted, without writing)
+
+import re
+import sys
+from collections import Counter
+from datetime import date, datetime, timedelta
+from storage import get_store, increment, scan
+
+# Characters Firebase does not allow in keys
+_UNSAFE_KEY = re.compile(r"[.$#\[\]/]")
+
+
+def _key(value):
+    return _UNSAFE_KEY.sub("_", str(value)) if value not in (None, "") else "unknown"
+
+
+def _service_date(booking):
+    try:
+        return datetime.strptime((booking.get("service_datetime") or "")[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def week_key(day):
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def counter_paths(booking):
+    """Counter paths a booking contributes one to."""
+    if not booking:
+        return []
+    status = _key(booking.get("status"))
+    category = _key(booking.get("category"))
+    paths = [
+        "stats/summary/total",
+        f"stats/summary/byStatus/{status}",
+        f"stats/summary/byCategory/{category}",
+    ]
+    day = _service_date(booking)
+    if day:
+        week = week_key(day)
+        paths += [
+            f"statsByDay/{day.isoformat()}/total",
+            f"statsByDay/{day.isoformat()}/byStatus/{status}",
+            f"statsByWeek/{week}/total",
+            f"statsByWeek/{week}/byCategory/{category}",
+        ]
+        if booking.get("assigned_mechanic"):
+            paths.append(f"statsByWeek/{week}/byMechanic/{_key(booking['assigned_mechanic'])}")
+    return paths
+
+
+def changes(before, after):
+    """Counter path -> amount that turns the counts for `before` into the counts for `after`."""
+    counts = Counter(counter_paths(after))
+    counts.subtract(counter_paths(before))
+    return Counter({path: amount for path, amount in counts.items() if amount})
+
+
+def deltas(before, after):
+    """Same as changes(), as server-side increments ready for a multi-location update."""
+    return {path: increment(amount) for path, amount in changes(before, after).items()}
+
+
+def summary(today=None, days=14):
+    """Aggregates for the analytics page: a handful of small reads, whatever the history size."""
+    store = get_store()
+    today = today or date.today()
+    # Service dates around today: the recent past and the upcoming schedule
+    start = today - timedelta(days=days // 2)
+    end = start + timedelta(days=days - 1)
+    found = store.get_many(["stats/summary", f"statsByWeek/{week_key(today)}"])
+    overall = found["stats/summary"] or {}
+    week = found[f"statsByWeek/{week_key(today)}"] or {}
+    by_day = store.query("statsByDay", "$key", start=start.isoformat(), end=end.isoformat())
+    by_category = overall.get("byCategory") or {}
+    return {
+        "total": overall.get("total", 0),
+        "by_status": overall.get("byStatus") or {},
+        "by_category": by_category,
+        "busiest_category": max(by_category, key=by_category.get) if by_category else None,
+        "week": week_key(today),
+        "week_total": week.get("total", 0),
+        "week_by_mechanic": week.get("byMechanic") or {},
+        "week_by_category": week.get("byCategory") or {},
+        "by_day": {day: (by_day.get(day) or {}).get("total", 0)
+                   for day in ((start + timedelta(days=i)).isoformat() for i in range(days))},
+    }
+
+
+def count_all(batch_size=1000):
+    """Recount every counter from serviceRequests and the archive, in key-ordered batches."""
+    store = get_store()
+    counts = Counter()
+    collections = ["serviceRequests"]
+    collections += [f"serviceRequestsArchive/{month}" for month in sorted(store.get("archiveMonths") or {})]
+    for collection in collections:
+        for batch in scan(collection, batch_size):
+            for booking in batch.values():
+                counts.update(counter_paths(booking))
+    return counts
+
+
+def _flatten(node, prefix, out):
+    if isinstance(node, dict):
+        for key, child in node.items():
+            _flatten(child, f"{prefix}/{key}", out)
+    elif isinstance(node, (int, float)):
+        out[prefix] = node
+    return out
+
+
+def current_counts():
+    store = get_store()
+    out = {}
+    _flatten(store.get("stats/summary"), "stats/summary", out)
+    _flatten(store.get("statsByDay"), "statsByDay", out)
+    _flatten(store.get("statsByWeek"), "statsByWeek", out)
+    return out
+
+
+def reconcile(write=True):
+    """Compare the stored counters with a full recount; fix them if write is set. Returns the drift."""
+    expected = count_all()
+    stored = current_counts()
+    drift = {path: (stored.get(path, 0), expected.get(path, 0))
+             for path in set(expected) | set(stored) if stored.get(path, 0) != expected.get(path, 0)}
+    if write and drift:
+        store = get_store()
+        nodes = {"stats/summary": {}, "statsByDay": {}, "statsByWeek": {}}
+        for path, value in expected.items():
+            root = "stats/summary" if path.startswith("stats/summary") else path.split("/", 1)[0]
+            node = nodes[root]
+            parts = path[len(root) + 1:].split("/")
+            for part in parts[:-1]:
+                node = node.setdefault(part, {})
+            node[parts[-1]] = value
+        for root, value in nodes.items():
+            store.set(root, value or None)
+    return drift
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] not in (["rebuild"], ["check"]):
+        sys.exit("Usage: python stats.py rebuild|check")
+    from dotenv import load_dotenv
+    load_dotenv()
+    drift = reconcile(write=sys.argv[1] == "rebuild")
+    for path, (stored, expected) in sorted(drift.items()):
+        print(f"{path}: stored {stored}, counted {expected}")
+    print(f"{len(drift)} counter(s) {'fixed' if sys.argv[1] == 'rebuild' else 'out of step'}")
@@ -0,0 +1,602 @@
+# Storage backends.
+# The rest of the app talks to the database only through the store returned by
+# get_store(). Paths and query semantics follow the Firebase Realtime Database
+# ("serviceRequests/<key>/status", order by a child, start/end/equal, limit), so
+# the Firebase backend is a thin adapter and the SQLite backend can be used for
+# local runs, benchmarks and tests without a Firebase project.
+#
+#   STORAGE_BACKEND=firebase (default)  uses SERVICE_ACCOUNT_PATH / FIREBASE_DB_URL
+#   STORAGE_BACKEND=sqlite              uses SQLITE_PATH (default ":memory:")
+
+import copy
+import json
+import os
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "database.rules.json")
+
+
+class AccountExists(Exception):
+    pass
+
+
+class AccountNotFound(Exception):
+    pass
+
+
+# Firebase-style push keys: 8 chars of timestamp followed by 12 random chars, so
+# keys sort in creation order.
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+_push_lock = threading.Lock()
+_last_push = [0, []]
+
+
+def push_key():
+    with _push_lock:
+        now = int(time.time() * 1000)
+        if now == _last_push[0]:
+            # Same millisecond: increment the random part to keep keys ordered
+            rand = _last_push[1]
+            i = 11
+            while i >= 0 and rand[i] == 63:
+                rand[i] = 0
+                i -= 1
+            if i >= 0:
+                rand[i] += 1
+        else:
+            rand = [secrets.randbelow(64) for _ in range(12)]
+        _last_push[0], _last_push[1] = now, rand
+    stamp = []
+    for _ in range(8):
+        stamp.append(PUSH_CHARS[now % 64])
+        now //= 64
+    return "".join(reversed(stamp)) + "".join(PUSH_CHARS[c] for c in rand)
+
+
+def increment(amount=1):
+    """Server-side increment, usable as a value in set() and update() on every backend."""
+    return {".sv": {"increment": amount}}
+
+
+def _increment_amount(value):
+    if isinstance(value, dict) and isinstance(value.get(".sv"), dict):
+        return value[".sv"].get("increment")
+    return None
+
+
+def split_path(path):
+    return [part for part in (path or "").split("/") if part]
+
+
+class FirebaseStore:
+    def __init__(self, service_account_path, database_url):
+        import firebase_admin
+        from firebase_admin import credentials, auth, db
+
+        # One Firebase app per process: the HTTP sessions of an app created before a
+        # fork must not be used by the forked workers
+        name = f"store-{os.getpid()}"
+        try:
+            self._app = firebase_admin.get_app(name)
+        except ValueError:
+            cred = credentials.Certificate(service_account_path)
+            self._app = firebase_admin.initialize_app(cred, {"databaseURL": database_url}, name=name)
+            # stderr, so it does not end up in output piped from admin.py export
+            print("Firebase initialized", file=sys.stderr)
+        self._auth = auth
+        self._db = db
+        self._pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="firebase")
+
+    def _ref(self, path):
+        return self._db.reference(path or "/", app=self._app)
+
+    def get(self, path):
+        return self._ref(path).get()
+
+    def get_many(self, paths):
+        """Read several paths in one go. Returns {path: value}."""
+        paths = list(dict.fromkeys(paths))
+        return dict(zip(paths, self._pool.map(self.get, paths)))
+
+    def set(self, path, value):
+        ref = self._ref(path)
+        if value is None:
+            ref.delete()
+        else:
+            ref.set(value)
+
+    def update(self, path, updates):
+        """Atomic multi-location update, relative to path."""
+        if updates:
+            self._ref(path).update(updates)
+
+    def claim(self, path, value):
+        """Set path to value only if nothing is stored there yet. Returns True if it was set."""
+        result = self._ref(path).transaction(lambda current: value if current is None else current)
+        return result == value
+
+    def query(self, path, order_by, start=None, end=None, equal=None, limit=None):
+        ref = self._ref(path)
+        query = ref.order_by_key() if order_by == "$key" else ref.order_by_child(order_by)
+        if equal is not None:
+            query = query.equal_to(equal)
+        if start is not None:
+            query = query.start_at(start)
+        if end is not None:
+            query = query.end_at(end)
+        if limit is not None:
+            query = query.limit_to_first(limit)
+        return query.get() or OrderedDict()
+
+    def listen(self, path, callback):
+        """Call callback(key, record, previous) for every record written under path.
+
+        Uses one Realtime Database stream. The stream starts with a snapshot of the
+        whole node, which is kept as a mirror so partial updates can be turned into
+        full records.
+        """
+        mirror = {}
+        started = [False]
+
+        def apply(parts, value, touched):
+            key = parts[0]
+            if len(parts) == 1:
+                if value is None:
+                    mirror.pop(key, None)
+                else:
+                    mirror[key] = value
+            else:
+                node = mirror.setdefault(key, {})
+                for part in parts[1:-1]:
+                    node = node.setdefault(part, {})
+                if value is None:
+                    node.pop(parts[-1], None)
+                else:
+                    node[parts[-1]] = value
+            touched.append(key)
+
+        def on_event(event):
+            parts = split_path(event.path)
+            touched = []
+            if not parts and event.event_type == "put":
+                previous = dict(mirror)
+                mirror.clear()
+                mirror.update(event.data or {})
+                if not started[0]:
+                    started[0] = True
+                    return
+                touched = list(dict.fromkeys(list(previous) + list(mirror)))
+            else:
+                # apply() edits records in place, so keep copies of the ones it touches
+                if event.event_type == "patch":
+                    changes = [(parts + split_path(rel), value) for rel, value in (event.data or {}).items()]
+                else:
+                    changes = [(parts, event.data)]
+                previous = {p[0]: copy.deepcopy(mirror.get(p[0])) for p, _ in changes if p}
+                for change_parts, value in changes:
+                    apply(change_parts, value, touched)
+            for key in dict.fromkeys(touched):
+                callback(key, mirror.get(key), previous.get(key))
+
+        return self._ref(path).listen(on_event)
+
+    def create_account(self, email, password, uid=None):
+        try:
+            return self._auth.create_user(uid=uid, email=email, password=password, app=self._app).uid
+        except self._auth.EmailAlreadyExistsError as e:
+            raise AccountExists(email) from e
+        except self._auth.UidAlreadyExistsError as e:
+            # Created by an earlier run of the same import: nothing to do
+            existing = self._auth.get_user(uid, app=self._app)
+            if (existing.email or "").lower() == (email or "").lower():
+                return uid
+            raise AccountExists(email) from e
+
+    def find_account(self, email):
+        try:
+            return self._auth.get_user_by_email(email, app=self._app).uid
+        except self._auth.UserNotFoundError as e:
+            raise AccountNotFound(email) from e
+
+    def delete_account(self, uid):
+        try:
+            self._auth.delete_user(uid, app=self._app)
+        except self._auth.UserNotFoundError as e:
+            raise AccountNotFound(uid) from e
+
+    def list_accounts(self):
+        """Yield (uid, email) for every login account, a page at a time."""
+        for user in self._auth.list_users(app=self._app).iterate_all():
+            yield user.uid, user.email
+
+
+# Embedded backend. Every record (a child of a collection such as users/<uid> or
+# serviceRequests/<key>) is one row holding its JSON; deeper paths are read and
+# written inside that JSON. Fields listed under .indexOn in database.rules.json get
+# an expression index, so queries are served the same way Firebase serves them.
+class SQLiteStore:
+    # Collections whose records sit one level deeper, e.g. archive/<month>/<key>
+    NESTED_COLLECTIONS = ("serviceRequestsArchive", "archiveByClient")
+    CHANGE_LOG_SIZE = 10000
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, path=":memory:", rules_path=RULES_PATH):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()
+        self._writes = 0
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS nodes ("
+                " parent TEXT NOT NULL, key TEXT NOT NULL, data TEXT NOT NULL,"
+                " PRIMARY KEY (parent, key))"
+            )
+            # Recently written records, read by listen() to emulate Firebase streaming
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS changes ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT, parent TEXT NOT NULL, key TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS accounts ("
+                " email TEXT PRIMARY KEY, uid TEXT NOT NULL, password_hash TEXT NOT NULL)"
+            )
+            for parent, field in self._indexed_fields(rules_path):
+                name = f"idx_{parent}_{field}".replace("/", "_").replace("$", "")
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {name} ON nodes (parent, json_extract(data, '$.{field}'))"
+                )
+
+    @staticmethod
+    def _indexed_fields(rules_path):
+        if not rules_path or not os.path.exists(rules_path):
+            return []
+        with open(rules_path, encoding="utf-8") as f:
+            rules = json.load(f).get("rules", {})
+        fields = []
+        for parent, node in rules.items():
+            if isinstance(node, dict):
+                fields += [(parent, field) for field in node.get(".indexOn", [])]
+        return fields
+
+    def _record_depth(self, parts):
+        return 3 if parts and parts[0] in self.NESTED_COLLECTIONS else 2
+
+    # --- reads ---
+    def _read(self, parts):
+        depth = self._record_depth(parts)
+        if len(parts) >= depth:
+            row = self._conn.execute(
+                "SELECT data FROM nodes WHERE parent = ? AND key = ?",
+                ("/".join(parts[:depth - 1]), parts[depth - 1]),
+            ).fetchone()
+            value = json.loads(row[0]) if row else None
+            for part in parts[depth:]:
+                value = value.get(part) if isinstance(value, dict) else None
+            return value
+        prefix = "/".join(parts)
+        if prefix:
+            rows = self._conn.execute(
+                "SELECT parent, key, data FROM nodes WHERE parent = ? OR (parent >= ? AND parent < ?)"
+                " ORDER BY parent, key",
+                (prefix, prefix + "/", prefix + "0"),
+            ).fetchall()
+        else:
+            rows = self._conn.execute("SELECT parent, key, data FROM nodes ORDER BY parent, key").fetchall()
+        if not rows:
+            return None
+        tree = OrderedDict()
+        for parent, key, data in rows:
+            node = tree
+            for part in split_path(parent)[len(parts):]:
+                node = node.setdefault(part, OrderedDict())
+            node[key] = json.loads(data)
+        return tree
+
+    def get(self, path):
+        with self._lock:
+            return self._read(split_path(path))
+
+    def get_many(self, paths):
+        """Read several paths in one go. Returns {path: value}."""
+        with self._lock:
+            return {path: self._read(split_path(path)) for path in dict.fromkeys(paths)}
+
+    # --- writes ---
+    def _write(self, parts, value):
+        depth = self._record_depth(parts)
+        amount = _increment_amount(value)
+        if amount is not None:
+            current = self._read(parts)
+            value = (current if isinstance(current, (int, float)) else 0) + amount
+        if len(parts) > depth:
+            record = self._read(parts[:depth]) or {}
+            node = record
+            for part in parts[depth:-1]:
+                if not isinstance(node.get(part), dict):
+                    node[part] = {}
+                node = node[part]
+            if value is None:
+                node.pop(parts[-1], None)
+            else:
+                node[parts[-1]] = value
+            self._write(parts[:depth], _prune(record))
+        elif len(parts) == depth:
+            parent, key = "/".join(parts[:-1]), parts[-1]
+            if value is None:
+                self._conn.execute("DELETE FROM nodes WHERE parent = ? AND key = ?", (parent, key))
+            else:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO nodes (parent, key, data) VALUES (?, ?, ?)",
+                    (parent, key, json.dumps(value)),
+                )
+            self._conn.execute("INSERT INTO changes (parent, key) VALUES (?, ?)", (parent, key))
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                self._conn.execute(
+                    "DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?", (self.CHANGE_LOG_SIZE,)
+                )
+        else:
+            prefix = "/".join(parts)
+            if value is not None and not isinstance(value, dict):
+                raise ValueError(f"Only objects can be stored at /{prefix}")
+            if prefix:
+                self._conn.execute(
+                    "DELETE FROM nodes WHERE parent = ? OR (parent >= ? AND parent < ?)",
+                    (prefix, prefix + "/", prefix + "0"),
+                )
+            else:
+                self._conn.execute("DELETE FROM nodes")
+            for key, child in (value or {}).items():
+                self._write(parts + split_path(key), child)
+
+    def set(self, path, value):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._write(split_path(path), value)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def update(self, path, updates):
+        """Atomic multi-location update, relative to path."""
+        base = split_path(path)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for key, value in updates.items():
+                    self._write(base + split_path(key), value)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def claim(self, path, value):
+        """Set path to value only if nothing is stored there yet. Returns True if it was set."""
+        parts = split_path(path)
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so other processes cannot claim in between
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                claimed = self._read(parts) is None
+                if claimed:
+                    self._write(parts, value)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return claimed
+
+    # --- queries ---
+    def query(self, path, order_by, start=None, end=None, equal=None, limit=None):
+        parts = split_path(path)
+        if len(parts) != self._record_depth(parts) - 1:
+            raise ValueError(f"Cannot query {path}: not a collection")
+        column = "key" if order_by == "$key" else f"json_extract(data, '$.{order_by}')"
+        sql = f"SELECT key, data FROM nodes WHERE parent = ? AND {column} IS NOT NULL"
+        params = ["/".join(parts)]
+        if equal is not None:
+            sql += f" AND {column} = ?"
+            params.append(equal)
+        if start is not None:
+            sql += f" AND {column} >= ?"
+            params.append(start)
+        if end is not None:
+            sql += f" AND {column} <= ?"
+            params.append(end)
+        sql += f" ORDER BY {column}, key"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return OrderedDict((key, json.loads(data)) for key, data in rows)
+
+    # --- change feed ---
+    def listen(self, path, callback):
+        """Call callback(key, record, previous) for every record written under path, by
+        polling the change log. Like the Firebase stream, it starts from a snapshot of
+        the node, so the previous version of a changed record is known."""
+        parent = "/".join(split_path(path))
+        with self._lock:
+            last = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+            mirror = dict(self._read(split_path(parent)) or {})
+        return _Poller(self, parent, last, mirror, callback)
+
+    def _changes_since(self, parent, seq):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, key FROM changes WHERE parent = ? AND seq > ? ORDER BY seq", (parent, seq)
+            ).fetchall()
+            if not rows:
+                return seq, {}
+            keys = list(dict.fromkeys(key for _, key in rows))
+            records = {key: self._read(split_path(parent) + [key]) for key in keys}
+            return rows[-1][0], records
+
+    # --- accounts (stand-in for Firebase Auth) ---
+    def create_account(self, email, password, uid=None):
+        from werkzeug.security import generate_password_hash
+
+        uid = uid or secrets.token_urlsafe(21)
+        with self._lock:
+            # Same rules as Firebase Auth: a uid belongs to one email
+            row = self._conn.execute("SELECT email FROM accounts WHERE uid = ?", (uid,)).fetchone()
+            if row:
+                if row[0] == email.lower():
+                    return uid
+                raise AccountExists(email)
+            try:
+                self._conn.execute(
+                    "INSERT INTO accounts (email, uid, password_hash) VALUES (?, ?, ?)",
+                    (email.lower(), uid, generate_password_hash(password)),
+                )
+            except sqlite3.IntegrityError as e:
+                raise AccountExists(email) from e
+        return uid
+
+    def find_account(self, email):
+        with self._lock:
+            row = self._conn.execute("SELECT uid FROM accounts WHERE email = ?", ((email or "").lower(),)).fetchone()
+        if not row:
+            raise AccountNotFound(email)
+        return row[0]
+
+    def delete_account(self, uid):
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM accounts WHERE uid = ?", (uid,)).rowcount
+        if not deleted:
+            raise AccountNotFound(uid)
+
+    def list_accounts(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT uid, email FROM accounts ORDER BY uid").fetchall()
+        yield from rows
+
+
+class _Poller:
+    def __init__(self, store, parent, seq, mirror, callback):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(store, parent, seq, mirror, callback),
+                                        name=f"listen-{parent}", daemon=True)
+        self._thread.start()
+
+    def _run(self, store, parent, seq, mirror, callback):
+        while not self._stop.wait(store.POLL_INTERVAL):
+            try:
+                seq, records = store._changes_since(parent, seq)
+                for key, record in records.items():
+                    previous = mirror.pop(key, None)
+                    if record is not None:
+                        mirror[key] = record
+                    callback(key, record, previous)
+            except Exception as e:
+                print(f"Change feed for {parent} failed: {e}")
+
+    def close(self):
+        self._stop.set()
+
+
+def _prune(value):
+    # Firebase drops empty objects; keep the same shape
+    if isinstance(value, dict):
+        value = {k: _prune(v) for k, v in value.items()}
+        value = {k: v for k, v in value.items() if v is not None and v != {}}
+        return value or None
+    return value
+
+
+def open_store(backend=None):
+    backend = backend or os.getenv("STORAGE_BACKEND", "firebase")
+    if backend == "sqlite":
+        return SQLiteStore(os.getenv("SQLITE_PATH", ":memory:"))
+    if backend == "firebase":
+        return FirebaseStore(os.getenv("SERVICE_ACCOUNT_PATH"), os.getenv("FIREBASE_DB_URL"))
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+_store = None
+_store_lock = threading.Lock()
+# Store opened by get_store() rather than passed to set_store()
+_store_opened = False
+# Wrappers applied to the active store, e.g. timing for /metrics
+_wrappers = []
+
+
+def _wrap(store):
+    for wrapper in _wrappers:
+        store = wrapper(store)
+    return store
+
+
+def get_store():
+    global _store, _store_opened
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = _wrap(open_store())
+                _store_opened = True
+    return _store
+
+
+def set_store(store):
+    """Replace the active store (local runs, benchmarks, tests)."""
+    global _store, _store_opened
+    with _store_lock:
+        _store = _wrap(store)
+        _store_opened = False
+
+
+def wrap_store(wrapper):
+    """Wrap the active store, and any store opened later, with wrapper(store). Idempotent."""
+    global _store
+    with _store_lock:
+        if wrapper in _wrappers:
+            return
+        _wrappers.append(wrapper)
+        if _store is not None:
+            _store = wrapper(_store)
+
+
+def scan(collection, batch_size=1000, order_by="$key", start=None, end=None):
+    """Yield every record of a collection as {key: value} batches, in order_by order.
+
+    Each batch is one query that starts at the last row of the previous one, so only
+    a batch is held in memory. order_by values must be unique, like keys or the
+    idx_* fields of serviceRequests.
+    """
+    store = get_store()
+    cursor = start
+    resumed = False
+    while True:
+        batch = store.query(collection, order_by, start=cursor, end=end, limit=batch_size + 1)
+        rows = OrderedDict(
+            (key, value) for key, value in batch.items()
+            # The first row of a resumed query is the last one already yielded
+            if not resumed or (key if order_by == "$key" else value.get(order_by)) != cursor
+        )
+        if rows:
+            yield rows
+        if len(batch) <= batch_size or not rows:
+            return
+        key, value = next(reversed(rows.items()))
+        cursor = key if order_by == "$key" else value.get(order_by)
+        resumed = True
+
+
+def _after_fork():
+    # A forked worker opens its own connection on first use instead of sharing the parent's
+    global _store, _store_lock
+    _store_lock = threading.Lock()
+    if _store_opened:
+        _store = None
+
+
+os.register_at_fork(after_in_child=_after_fork)
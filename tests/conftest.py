@@ -0,0 +1,61 @@
+# Every test runs against a fresh in-memory SQLite store, no Firebase needed.
+#   python -m pytest -q
+
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("EMAIL_DEAD_LETTER_PATH", "")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import users
+from storage import SQLiteStore, set_store
+
+
+@pytest.fixture(autouse=True)
+def store():
+    store = SQLiteStore(":memory:")
+    set_store(store)
+    # Module caches would otherwise carry data from one test's store into the next
+    users.user_cache.clear()
+    users.mechanic_cache.clear()
+    users.email_cache.clear()
+    return store
+
+
+class FakeTransport:
+    """SMTP stand-in that records (to, subject) instead of sending."""
+
+    def __init__(self):
+        self.sent = []
+
+    def connect(self):
+        return self
+
+    def send_message(self, message):
+        self.sent.append((message["To"], message["Subject"]))
+
+    def noop(self):
+        pass
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def app(store):
+    import app as app_module
+    notifier = app_module.get_notifier()
+    notifier.transport = FakeTransport()
+    notifier.backoff = 0
+    return app_module.create_app({"TESTING": True})
+
+
+def login(client, store, email, role):
+    """Create a user with this role and log the test client in as them."""
+    uid = store.create_account(email, "Passw0rd!")
+    users.save_user_profile(uid, {"name": role.title(), "surname": "Test", "email": email, "phone": "1", "role": role})
+    client.post("/login", data={"email": email, "password": "Passw0rd!"})
+    return uid
@@ -0,0 +1,53 @@
+import io
+import json
+
+import pytest
+
+import admin
+from storage import AccountExists
+
+
+def write_ndjson(path, records):
+    path.write_text("".join(json.dumps(record) + "\n" for record in records), encoding="utf-8")
+    return str(path)
+
+
+def users_file(tmp_path):
+    return write_ndjson(tmp_path / "users.ndjson", [
+        {"key": "uid-a", "password": "pw-a", "value": {"email": "a@example.com", "role": "client"}},
+        {"key": "uid-m", "password": "pw-m", "value": {"email": "m@example.com", "role": "mechanic", "name": "M"}},
+    ])
+
+
+def test_user_import_can_run_again(tmp_path, store):
+    source = users_file(tmp_path)
+    assert admin.import_records("users", source, 1, None, 2) == 2
+    # A second run meets the uids it created the first time
+    assert admin.import_records("users", source, 1, None, 2) == 2
+    assert store.find_account("a@example.com") == "uid-a"
+    assert store.get("mechanics/uid-m")["email"] == "m@example.com"
+
+
+def test_uid_held_by_another_email_is_skipped(tmp_path, store):
+    store.create_account("someone@example.com", "pw", uid="uid-a")
+    with pytest.raises(AccountExists):
+        store.create_account("a@example.com", "pw", uid="uid-a")
+    admin.import_records("users", users_file(tmp_path), 10, None, 2)
+    assert store.get("users/uid-a") is None
+    assert store.get("users/uid-m")["email"] == "m@example.com"
+
+
+def test_export_and_import_round_trip(tmp_path, store):
+    admin.import_records("users", users_file(tmp_path), 1, None, 2)
+    out = io.StringIO()
+    assert admin.export_records("users", out, 1) == 2
+    assert [json.loads(line)["key"] for line in out.getvalue().splitlines()] == ["uid-a", "uid-m"]
+
+
+def test_import_resumes_from_checkpoint(tmp_path, store):
+    source = users_file(tmp_path)
+    checkpoint = str(tmp_path / "users.ckpt")
+    admin.write_checkpoint(checkpoint, source, 1)
+    assert admin.import_records("users", source, 10, checkpoint, 2) == 1
+    assert store.get("users/uid-a") is None
+    assert store.get("users/uid-m") is not None
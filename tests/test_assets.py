@@ -0,0 +1,77 @@
+import gzip
+import json
+import os
+
+import pytest
+from flask import Flask, url_for
+
+import assets
+
+CSS = b"body { color: #123456; }\n" * 50
+
+
+@pytest.fixture
+def static(tmp_path, monkeypatch):
+    static_dir = tmp_path / "static"
+    (static_dir / "images").mkdir(parents=True)
+    (static_dir / "styles.css").write_bytes(CSS)
+    (static_dir / "images" / "logo.txt").write_text("logo")
+    monkeypatch.setattr(assets, "STATIC_DIR", str(static_dir))
+    monkeypatch.setattr(assets, "DIST_DIR", str(static_dir / "dist"))
+    monkeypatch.setattr(assets, "MANIFEST_PATH", str(static_dir / "dist" / "manifest.json"))
+    return static_dir
+
+
+def built_app():
+    app = Flask(__name__)
+    assets.init_app(app)
+    return app
+
+
+def test_names_change_only_with_the_content(static):
+    manifest = assets.build()
+    css = manifest["styles.css"]["file"]
+    assert css == f"styles.{assets.content_hash(static / 'styles.css')}.css"
+    assert manifest["images/logo.txt"]["file"].startswith("images/logo.")
+    assert json.loads((static / "dist" / "manifest.json").read_text()) == manifest
+    assert gzip.decompress((static / "dist" / (css + ".gz")).read_bytes()) == CSS
+    assert assets.build()["styles.css"]["file"] == css
+    (static / "styles.css").write_bytes(CSS + b"p {}\n")
+    assert assets.build()["styles.css"]["file"] != css
+
+
+def test_url_for_points_at_the_built_file(static):
+    manifest = assets.build()
+    app = built_app()
+    with app.test_request_context():
+        assert url_for("static", filename="styles.css") == "/static/dist/" + manifest["styles.css"]["file"]
+        assert url_for("static", filename="unknown.js") == "/static/unknown.js"
+
+
+@pytest.mark.parametrize("accept, encoding", [
+    ("gzip, deflate, br", "br"),
+    ("gzip, deflate", "gzip"),
+    ("", None),
+])
+def test_best_accepted_encoding_is_served(static, accept, encoding):
+    css = assets.build()["styles.css"]["file"]
+    # A stand-in .br file, so the test does not need the brotli package
+    (static / "dist" / (css + ".br")).write_bytes(b"brotli bytes")
+    client = built_app().test_client()
+    response = client.get(f"/static/dist/{css}", headers={"Accept-Encoding": accept})
+    assert response.headers.get("Content-Encoding") == encoding
+    assert response.headers["Cache-Control"] == assets.IMMUTABLE
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.mimetype == "text/css"
+    if encoding == "gzip":
+        assert gzip.decompress(response.data) == CSS
+    else:
+        assert response.data == (b"brotli bytes" if encoding == "br" else CSS)
+
+
+def test_without_a_build_static_is_served_as_before(static):
+    assert not os.path.exists(assets.MANIFEST_PATH)
+    app = built_app()
+    with app.test_request_context():
+        assert url_for("static", filename="styles.css") == "/static/styles.css"
+        assert app.jinja_env.globals["webp_srcset"]("images/bg1.png") == ""
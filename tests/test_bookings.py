@@ -0,0 +1,89 @@
+import random
+
+import app as app_module
+import bookings
+from bookings import create_booking, page_bookings
+from conftest import login
+
+
+def make_bookings(n, seed=1):
+    rnd = random.Random(seed)
+    keys = {}
+    for i in range(n):
+        booking = {
+            "client_id": f"client{i % 4}",
+            "status": rnd.choice(["pending", "assigned", "completed", "cancelled"]),
+            "category": rnd.choice(["Light", "Heavy"]),
+            "service_datetime": f"2030-03-{rnd.randint(1, 28):02d} {rnd.randint(8, 16):02d}:00",
+        }
+        key, _ = create_booking(booking)
+        keys[key] = booking
+    return keys
+
+
+def all_pages(limit, **filters):
+    pages = []
+    cursor = None
+    while True:
+        page, cursor = page_bookings(cursor=cursor, limit=limit, **filters)
+        pages.append(page)
+        if cursor is None:
+            return pages
+
+
+def test_pages_cover_every_matching_booking_once_in_date_order():
+    bookings = make_bookings(120)
+    expected = {key for key, b in bookings.items() if b["status"] in ("pending", "assigned")}
+    pages = all_pages(25)
+    keys = [key for page in pages for key in page]
+    assert len(keys) == len(set(keys))
+    assert set(keys) == expected
+    assert all(len(page) <= 25 for page in pages)
+    dates = [page[key]["service_datetime"] for page in pages for key in page]
+    assert dates == sorted(dates)
+
+
+def test_status_and_category_filters():
+    bookings = make_bookings(90, seed=2)
+    pages = all_pages(10, status="completed", category="Heavy")
+    keys = {key for page in pages for key in page}
+    assert keys == {key for key, b in bookings.items()
+                    if b["status"] == "completed" and b["category"] == "Heavy"}
+
+
+def test_date_range_is_inclusive():
+    bookings = make_bookings(60, seed=3)
+    pages = all_pages(7, status=None, date_from="2030-03-10", date_to="2030-03-12")
+    keys = {key for page in pages for key in page}
+    assert keys == {key for key, b in bookings.items() if "2030-03-10" <= b["service_datetime"][:10] <= "2030-03-12"}
+
+
+def test_last_page_has_no_cursor():
+    make_bookings(5, seed=4)
+    page, cursor = page_bookings(status=None, limit=50)
+    assert len(page) == 5
+    assert cursor is None
+
+
+def test_cursor_only_when_the_scan_budget_stops_early(monkeypatch):
+    monkeypatch.setattr(bookings, "MAX_SCAN", 12)
+    for i in range(12):
+        create_booking({"status": "pending", "category": "Light", "service_datetime": f"2030-03-{i + 1:02d} 10:00"})
+    # The budget runs out exactly at the end of the range: nothing is left to page to
+    assert page_bookings(category="Heavy", limit=4) == ({}, None)
+    for i in range(12, 18):
+        create_booking({"status": "pending", "category": "Light", "service_datetime": f"2030-03-{i + 1:02d} 10:00"})
+    create_booking({"status": "pending", "category": "Heavy", "service_datetime": "2030-03-20 10:00"})
+    page, cursor = page_bookings(category="Heavy", limit=4)
+    assert page == {} and cursor
+    page, cursor = page_bookings(category="Heavy", limit=4, cursor=cursor)
+    assert [b["service_datetime"] for b in page.values()] == ["2030-03-20 10:00"]
+    assert cursor is None
+
+
+def test_admin_can_filter_by_every_status(app, store):
+    client = app.test_client()
+    login(client, store, "admin@example.com", "admin")
+    html = client.get(app_module.HASHES["admin_dashboard"]).get_data(as_text=True)
+    for status in ("pending", "assigned", "completed", "cancelled"):
+        assert f'<option value="{status}"' in html
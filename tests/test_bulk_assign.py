@@ -0,0 +1,55 @@
+import app as app_module
+from bookings import create_booking
+from conftest import login
+
+URL = app_module.HASHES["bulk_assign"]
+
+
+def test_invalid_json_is_a_400(app, store):
+    client = app.test_client()
+    login(client, store, "admin@example.com", "admin")
+    response = client.post(URL, data="{not json", content_type="application/json")
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_wrong_shape_is_a_400(app, store):
+    client = app.test_client()
+    login(client, store, "admin@example.com", "admin")
+    for body in ([1, 2], {"assignments": ["x"]}, {"assignments": [{"booking_id": ["x"], "mechanic_id": "m"}]}):
+        assert client.post(URL, json=body).status_code == 400
+
+
+def test_non_admin_json_gets_403(app, store):
+    client = app.test_client()
+    login(client, store, "client@example.com", "client")
+    response = client.post(URL, json={"assignments": []})
+    assert response.status_code == 403
+    assert response.get_json() == {"error": "Access denied"}
+
+
+def test_assigns_and_reports_skipped(app, store):
+    client = app.test_client()
+    login(client, store, "admin@example.com", "admin")
+    mechanic = login(app.test_client(), store, "mech@example.com", "mechanic")
+    key, _ = create_booking({"status": "pending", "category": "Light", "service_datetime": "2030-01-01 10:00"})
+    response = client.post(URL, json={"assignments": [{"booking_id": key, "mechanic_id": mechanic},
+                                                      {"booking_id": "nope", "mechanic_id": mechanic}]})
+    assert response.get_json() == {"assigned": [key], "skipped": {"nope": "booking not found"}}
+    assert store.get(f"serviceRequests/{key}/assigned_mechanic") == mechanic
+
+
+def test_store_failure_is_reported_not_a_500(app, store, monkeypatch):
+    client = app.test_client()
+    login(client, store, "admin@example.com", "admin")
+    mechanic = login(app.test_client(), store, "mech@example.com", "mechanic")
+    key, _ = create_booking({"status": "pending", "category": "Light", "service_datetime": "2030-01-01 10:00"})
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("database unavailable")
+    monkeypatch.setattr(app_module, "update_bookings", fail)
+    response = client.post(URL, json={"assignments": [{"booking_id": key, "mechanic_id": mechanic}]})
+    assert response.status_code == 503
+    assert "database unavailable" in response.get_json()["error"]
+    response = client.post(URL, data={f"assign-{key}": mechanic})
+    assert response.status_code == 302
@@ -0,0 +1,38 @@
+import time
+
+import users
+from cache import TTLCache
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert len(cache) == 2
+
+
+def test_entries_expire_and_can_be_invalidated():
+    cache = TTLCache(ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.invalidate("b")
+    assert cache.get("b", "gone") == "gone"
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_profiles_are_read_once_and_refreshed_after_a_save(store):
+    users.save_user_profile("u1", {"name": "Jo", "role": "client"})
+    reads = []
+    get = store.get
+    store.get = lambda path: reads.append(path) or get(path)
+    assert users.get_user_profile("u1")["name"] == "Jo"
+    assert users.get_user_profile("u1")["name"] == "Jo"
+    assert reads == ["users/u1"]
+    users.save_user_profile("u1", {"name": "Joanne", "role": "client"})
+    assert users.get_user_profile("u1")["name"] == "Joanne"
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+import events
+from events import ChangeFeed, booking_filter
+
+
+@pytest.fixture
+def feed(store, monkeypatch):
+    # Changes are published by hand, no upstream listener is needed
+    monkeypatch.setattr(store, "listen", lambda path, callback: object())
+    return ChangeFeed(max_streams=3)
+
+
+def drain(subscriber):
+    changes = []
+    while not subscriber.queue.empty():
+        _, key, booking = subscriber.queue.get()
+        changes.append((key, booking and booking["status"]))
+    return changes
+
+
+def test_subscribers_only_get_their_own_bookings(feed):
+    client = feed.subscribe(booking_filter("client", "c1"))
+    old = feed.subscribe(booking_filter("mechanic", "m1"))
+    new = feed.subscribe(booking_filter("mechanic", "m2"))
+    before = {"client_id": "c1", "assigned_mechanic": "m1", "status": "assigned"}
+    after = dict(before, assigned_mechanic="m2")
+    feed.publish("b1", after, before)
+    feed.publish("b2", {"client_id": "c2", "status": "pending"})
+    feed.publish("b1", None, after)
+    assert drain(client) == [("b1", "assigned"), ("b1", None)]
+    # Reassigned away: told it is gone, without the booking
+    assert drain(old) == [("b1", None)]
+    assert drain(new) == [("b1", "assigned"), ("b1", None)]
+    assert booking_filter("stranger", "x")(after) is False
+
+
+def test_streams_are_capped_per_process(feed):
+    subscribers = [feed.subscribe(booking_filter("admin", "a")) for _ in range(3)]
+    assert feed.subscribe(booking_filter("admin", "a")) is None
+    feed.unsubscribe(subscribers[0])
+    assert feed.subscribe(booking_filter("admin", "a")) is not None
+
+
+def test_reconnecting_browsers_get_what_they_missed(feed, monkeypatch):
+    monkeypatch.setattr(events, "REPLAY_MARGIN", 0)
+    feed.unsubscribe(feed.subscribe(booking_filter("admin", "a")))
+    feed.publish("b1", {"status": "pending"})
+    last_id = feed._history[-1][0]
+    feed.publish("b2", {"status": "assigned"})
+    resumed = feed.subscribe(booking_filter("admin", "a"), last_event_id=repr(last_id))
+    assert drain(resumed) == [("b2", "assigned")]
+    assert not resumed.lagging
+    # Ids from before this process started listening, or garbage, mean reload
+    for last_event_id in (str(feed._since - 60), "not-a-number"):
+        subscriber = feed.subscribe(booking_filter("admin", "a"), last_event_id=last_event_id)
+        assert subscriber.lagging
+        feed.unsubscribe(subscriber)
+
+
+def test_stream_sends_public_fields_and_ends(feed, monkeypatch):
+    monkeypatch.setattr(events, "STREAM_SECONDS", 0.2)
+    monkeypatch.setattr(events, "HEARTBEAT_SECONDS", 0.05)
+    subscriber = feed.subscribe(booking_filter("admin", "a"))
+    feed.publish("b1", {"status": "pending", "email": "private@example.com", "reference_number": "REF-1"})
+    messages = list(feed.stream(subscriber, describe=lambda booking: {"mechanic_name": None}))
+    assert messages[0].startswith("retry: ")
+    booking = json.loads(messages[1].split("data: ", 1)[1])
+    assert booking["key"] == "b1" and booking["reference_number"] == "REF-1"
+    assert "email" not in booking and "mechanic_name" in booking
+    assert ": heartbeat\n\n" in messages[2:]
+    # The stream gave its slot back when it ended
+    assert len(feed._subscribers) == 0
@@ -0,0 +1,47 @@
+import threading
+import time
+
+import pytest
+from flask import Flask, g, has_request_context, request
+
+from fanout import FanoutTimeout, gather
+
+
+def test_calls_run_concurrently_and_keep_their_order():
+    barrier = threading.Barrier(3, timeout=2)
+
+    def call(n):
+        # Would time out unless all three run at once
+        barrier.wait()
+        return n
+    assert gather(lambda: call(1), lambda: call(2), lambda: call(3)) == [1, 2, 3]
+    assert gather() == []
+    assert gather(lambda: "only") == ["only"]
+
+
+def test_first_error_is_raised():
+    def fail():
+        raise ValueError("boom")
+    with pytest.raises(ValueError, match="boom"):
+        gather(lambda: time.sleep(0.05), fail)
+
+
+def test_slow_calls_time_out():
+    def slow_read():
+        time.sleep(0.5)
+    with pytest.raises(FanoutTimeout, match="slow_read"):
+        gather(slow_read, lambda: None, timeout=0.05)
+
+
+def test_calls_see_the_request_context():
+    app = Flask(__name__)
+    with app.test_request_context("/page?x=1"):
+        g.user = "u1"
+        results = gather(lambda: (has_request_context(), request.args["x"]), lambda: g.user)
+    assert results == [(True, "1"), "u1"]
+
+
+def test_nested_gather_runs_inline():
+    results = gather(lambda: gather(lambda: 1, lambda: 2), lambda: threading.current_thread().name)
+    assert results[0] == [1, 2]
+    assert results[1].startswith("fanout")
@@ -0,0 +1,49 @@
+import random
+
+import pytest
+
+from geo import GridIndex, haversine_km, parse_coordinates
+
+
+def brute_force(points, lat, lng, k, accept):
+    found = sorted((haversine_km(lat, lng, p_lat, p_lng), item_id)
+                   for item_id, (p_lat, p_lng) in points.items() if accept(item_id))
+    return [item_id for _, item_id in found[:k]]
+
+
+@pytest.mark.parametrize("n, k, accepted, spread", [
+    (300, 5, 1.0, 0.5),     # dense city fleet
+    (300, 5, 0.3, 0.5),     # most mechanics unavailable
+    (40, 50, 1.0, 8.0),     # small country-wide fleet, k larger than it
+    (1, 3, 1.0, 8.0),
+    (25, 5, 0.0, 8.0),      # nobody available
+])
+def test_nearest_matches_brute_force(n, k, accepted, spread):
+    rnd = random.Random(n * 100 + k)
+    points = {f"m{i}": (-26 + rnd.uniform(-spread, spread), 28 + rnd.uniform(-spread, spread)) for i in range(n)}
+    index = GridIndex()
+    for item_id, (lat, lng) in points.items():
+        index.add(item_id, lat, lng)
+    allowed = set(rnd.sample(sorted(points), int(n * accepted)))
+    for _ in range(50):
+        lat, lng = -26 + rnd.uniform(-spread, spread), 28 + rnd.uniform(-spread, spread)
+        got = [item_id for _, item_id in index.nearest(lat, lng, k, allowed.__contains__)]
+        assert got == brute_force(points, lat, lng, k, allowed.__contains__)
+
+
+def test_moved_and_removed_points():
+    index = GridIndex()
+    index.add("a", -26.0, 28.0)
+    index.add("b", -26.1, 28.1)
+    index.add("a", -33.9, 18.4)
+    assert [item_id for _, item_id in index.nearest(-26.0, 28.0, 1)] == ["b"]
+    index.remove("b")
+    assert [item_id for _, item_id in index.nearest(-26.0, 28.0, 1)] == ["a"]
+    assert len(index) == 1
+    assert GridIndex().nearest(0, 0) == []
+
+
+def test_parse_coordinates():
+    assert parse_coordinates("-25.7", "28.2") == (-25.7, 28.2)
+    assert parse_coordinates("", "28") == (None, None)
+    assert parse_coordinates(91, 0) == (None, None)
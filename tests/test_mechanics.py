@@ -0,0 +1,19 @@
+import users
+
+
+def test_profiles_missing_from_the_directory_are_read_in_one_call(store):
+    users.save_user_profile("m1", {"name": "Listed", "role": "mechanic"})
+    store.set("users/m2", {"name": "Unlisted", "role": "mechanic"})
+    store.set("users/m3", {"name": "Also unlisted", "role": "mechanic"})
+    users.get_mechanics()
+    calls = []
+    get_many = store.get_many
+    store.get_many = lambda paths: calls.append(sorted(paths)) or get_many(calls[-1])
+    store.get = None  # one read per uid would fail
+    found = users.get_mechanic_profiles(["m1", "m2", "m3", "m2", "gone", None])
+    assert {uid: profile["name"] for uid, profile in found.items()} == {
+        "m1": "Listed", "m2": "Unlisted", "m3": "Also unlisted"}
+    assert calls == [["users/gone", "users/m2", "users/m3"]]
+    # Found profiles are cached, only the unknown uid is asked for again
+    users.get_mechanic_profiles(["m2", "gone"])
+    assert calls[-1] == ["users/gone"]
@@ -0,0 +1,117 @@
+import json
+import time
+
+from conftest import FakeTransport
+from notifications import Digest, Notifier
+
+
+class FlakyTransport(FakeTransport):
+    """Fails the first `failures` sends, then delivers."""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+        self.connects = 0
+
+    def connect(self):
+        self.connects += 1
+        return self
+
+    def send_message(self, message):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("connection reset")
+        super().send_message(message)
+
+
+def notifier(transport, **kwargs):
+    return Notifier(transport, "shop@example.com", workers=1, backoff=0, **kwargs)
+
+
+def test_messages_share_one_session():
+    transport = FlakyTransport(0)
+    n = notifier(transport)
+    for i in range(5):
+        n.send("a@example.com", f"Subject {i}", "body")
+    n.send("", "Nobody", "dropped")
+    assert n.flush(timeout=5)
+    n.stop()
+    assert transport.sent == [("a@example.com", f"Subject {i}") for i in range(5)]
+    assert transport.connects == 1
+
+
+def test_failed_sends_are_retried_on_a_new_session():
+    transport = FlakyTransport(2)
+    attempts = []
+    n = notifier(transport, max_retries=3, on_send=lambda seconds, ok: attempts.append(ok))
+    n.send("a@example.com", "Hello", "body")
+    n.stop()
+    assert transport.sent == [("a@example.com", "Hello")]
+    assert attempts == [False, False, True]
+    assert transport.connects == 3
+
+
+def test_undeliverable_messages_go_to_the_dead_letter_file(tmp_path):
+    path = tmp_path / "dead.jsonl"
+    transport = FlakyTransport(100)
+    n = notifier(transport, max_retries=2, dead_letter_path=str(path))
+    n.send("a@example.com", "Hello", "body")
+    n.stop()
+    assert transport.sent == []
+    [record] = [json.loads(line) for line in path.read_text().splitlines()]
+    assert record["to"] == "a@example.com"
+    assert record["subject"] == "Hello"
+    assert record["error"] == "connection reset"
+
+
+class Outbox:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, to, subject, body):
+        self.sent.append((to, subject, body.count("-" * 40) + 1))
+
+
+def wait_for(condition, seconds=2):
+    deadline = time.monotonic() + seconds
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_digest_goes_out_one_interval_after_the_first_item():
+    outbox = Outbox()
+    digest = Digest(outbox, "{count} new", interval=0.3, max_items=10)
+    digest.add("a@example.com", "one")
+    digest.add("a@example.com", "two")
+    digest.add("", "nobody")
+    assert digest.pending() == {"a@example.com": 2}
+    assert wait_for(lambda: outbox.sent)
+    assert outbox.sent == [("a@example.com", "2 new", 2)]
+    assert digest.pending() == {}
+    digest.stop()
+
+
+def test_full_digests_are_sent_at_once_and_stop_sends_the_rest():
+    outbox = Outbox()
+    digest = Digest(outbox, "{count} new", interval=60, max_items=3)
+    for i in range(4):
+        digest.add("a@example.com", f"item {i}")
+    digest.add("b@example.com", "other")
+    assert outbox.sent == [("a@example.com", "3 new", 3)]
+    digest.stop()
+    assert sorted(outbox.sent[1:]) == [("a@example.com", "1 new", 1), ("b@example.com", "1 new", 1)]
+
+
+def test_digest_thread_sleeps_between_deadlines():
+    outbox = Outbox()
+    digest = Digest(outbox, "{count} new", interval=60)
+    checks = []
+    flush = digest.flush
+    digest.flush = lambda due_only=False: checks.append(due_only) or flush(due_only)
+    digest.add("a@example.com", "one")
+    digest.add("b@example.com", "two")
+    time.sleep(0.3)
+    # Woken once per new recipient, then waiting for the oldest item to be due
+    assert len(checks) <= 2
+    digest.stop()
@@ -0,0 +1,69 @@
+import random
+from datetime import date, datetime, timedelta
+
+import app as app_module
+from bookings import create_booking
+from conftest import login
+from routing import Job, day_jobs, distance_matrix, plan_route, simulate
+
+DAY = datetime(2030, 5, 6)
+
+
+def job(key, hour, point, minute=0, category="Light"):
+    booking = {"service_datetime": f"2030-05-06 {hour:02d}:{minute:02d}", "category": category}
+    start = DAY + timedelta(hours=hour, minutes=minute)
+    return Job(key, booking, point, (start, start + timedelta(minutes=90)))
+
+
+def test_plan_is_never_worse_than_the_booked_order():
+    rnd = random.Random(7)
+    for _ in range(30):
+        jobs = [job(f"j{i}", rnd.randint(8, 15), (-26 + rnd.uniform(-0.3, 0.3), 28 + rnd.uniform(-0.3, 0.3)),
+                    minute=rnd.choice([0, 30])) for i in range(rnd.randint(1, 7))]
+        origin = (-26.0, 28.0)
+        plan = plan_route(jobs, origin)
+        assert sorted(stop[0].key for stop in plan["stops"]) == sorted(j.key for j in jobs)
+        depart = max(DAY + timedelta(hours=8), min(j.start for j in jobs) - timedelta(hours=1))
+        points = {j.point for j in jobs} | {origin}
+        booked = simulate(sorted(jobs, key=lambda j: j.start), origin, depart, distance_matrix(points))
+        assert plan["distance_km"] + 5.0 * plan["late_minutes"] <= booked[0] + 1e-6
+
+
+def test_jobs_at_the_same_time_are_visited_nearest_first():
+    origin = (-26.0, 28.0)
+    far, near = job("far", 10, (-26.2, 28.0)), job("near", 10, (-26.01, 28.0))
+    plan = plan_route([far, near], origin)
+    assert [stop[0].key for stop in plan["stops"]] == ["near", "far"]
+    assert plan["distance_km"] <= plan["scheduled_distance_km"]
+
+
+def test_jobs_without_a_location_are_listed_separately():
+    plan = plan_route([job("a", 9, None), job("b", 11, (-26.0, 28.0)), job("c", 8, None)])
+    assert [stop[0].key for stop in plan["stops"]] == ["b"]
+    assert [j.key for j in plan["unlocated"]] == ["c", "a"]
+    assert plan_route([]) == {"stops": [], "unlocated": [], "distance_km": 0.0, "late_minutes": 0.0,
+                              "scheduled_distance_km": 0.0}
+
+
+def test_day_jobs_skip_other_days_and_closed_jobs():
+    bookings = {
+        "a": {"service_datetime": "2030-05-06 09:00", "status": "assigned", "lat": "-26", "lng": "28"},
+        "b": {"service_datetime": "2030-05-07 09:00", "status": "assigned"},
+        "c": {"service_datetime": "2030-05-06 11:00", "status": "completed"},
+        "d": {"service_datetime": "2030-05-06 13:00", "status": "assigned"},
+    }
+    jobs = day_jobs(bookings, date(2030, 5, 6))
+    assert [(j.key, j.point) for j in jobs] == [("a", (-26.0, 28.0)), ("d", None)]
+
+
+def test_mechanics_get_their_own_route_as_json(app, store):
+    client = app.test_client()
+    uid = login(client, store, "mech@example.com", "mechanic")
+    create_booking({"service_datetime": "2030-05-06 09:00", "status": "assigned", "assigned_mechanic": uid,
+                    "category": "Light", "lat": "-26.1", "lng": "28.1"})
+    route = client.get(app_module.HASHES["route_plan"] + "?day=2030-05-06").get_json()
+    assert route["date"] == "2030-05-06"
+    assert [stop["start"] for stop in route["stops"]] == ["09:00"]
+    other = app.test_client()
+    login(other, store, "client@example.com", "client")
+    assert other.get(app_module.HASHES["route_plan"]).status_code == 403
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+from scheduling import Calendar, Schedule, job_interval
+from bookings import create_booking, update_booking
+
+DAY = datetime(2030, 5, 6)
+
+
+def at(hour, minute=0):
+    return DAY + timedelta(hours=hour, minutes=minute)
+
+
+def calendar(*jobs):
+    cal = Calendar()
+    for start, end, key in jobs:
+        cal.add(start, end, key)
+    return cal
+
+
+def test_overlapping_finds_only_jobs_that_intersect():
+    cal = calendar((at(8), at(11), "long"), (at(12), at(13), "noon"), (at(14), at(15), "late"))
+    assert [job[2] for job in cal.overlapping(at(10), at(12, 30))] == ["long", "noon"]
+    # Touching intervals do not overlap
+    assert cal.overlapping(at(11), at(12)) == []
+    assert cal.overlapping(at(15), at(16)) == []
+    # A long job that started well before the window is still found
+    assert [job[2] for job in cal.overlapping(at(10, 30), at(10, 45))] == ["long"]
+
+
+def test_add_replaces_and_remove_forgets():
+    cal = calendar((at(9), at(10), "a"), (at(9), at(10), "b"))
+    cal.add(at(13), at(14), "a")
+    assert [job[2] for job in cal.overlapping(at(9), at(10))] == ["b"]
+    cal.remove("b")
+    cal.remove("missing")
+    assert cal.overlapping(at(8), at(17)) == [(at(13), at(14), "a")]
+    assert len(cal) == 1
+
+
+def test_free_starts_skip_busy_time_on_the_slot_grid():
+    cal = calendar((at(9), at(10, 30), "a"), (at(13), at(16), "b"))
+    starts = cal.free_starts(at(8), at(17), timedelta(minutes=60), timedelta(minutes=30))
+    assert [t.strftime("%H:%M") for t in starts] == ["08:00", "10:30", "11:00", "11:30", "12:00", "16:00"]
+
+
+def test_free_starts_empty_calendar_and_no_room():
+    step = timedelta(minutes=30)
+    assert len(Calendar().free_starts(at(8), at(17), timedelta(hours=2), step)) == 15
+    full = calendar((at(8), at(17), "all day"))
+    assert full.free_starts(at(8), at(17), timedelta(minutes=30), step) == []
+
+
+def test_conflicts_see_jobs_assigned_by_another_process():
+    booking = {"service_datetime": "2030-05-06 10:00", "category": "Light", "status": "pending"}
+    first, _ = create_booking(booking)
+    second, _ = create_booking(booking)
+    mine, theirs = Schedule(), Schedule()
+    assert mine.conflicts("m1", second, booking) == []
+    theirs.assign("m1", first, update_booking(first, {"assigned_mechanic": "m1", "status": "assigned"}))
+    assert [job[2] for job in mine.conflicts("m1", second, booking)] == [first]
+    assert job_interval(booking) == (at(10), at(11, 30))
+
+
+def test_reload_reads_only_open_jobs_around_the_booking(store):
+    def booking(when, status="assigned", category="Light"):
+        return {"service_datetime": when, "category": category, "status": status, "assigned_mechanic": "m1"}
+    early, _ = create_booking(booking("2030-05-06 07:00", category="Heavy"))
+    create_booking(booking("2030-05-06 10:30", status="completed"))
+    create_booking(booking("2030-05-01 10:00"))
+    create_booking(booking("2030-05-07 10:00"))
+    for i in range(20):
+        create_booking(booking(f"2029-01-{i + 1:02d} 10:00", status="completed"))
+    sched = Schedule()
+    sched.free_slots(DAY.date())  # loads the calendars of this process
+    queries = []
+    query = store.query
+    store.query = lambda *args, **kwargs: queries.append((args, kwargs)) or query(*args, **kwargs)
+    new = {"service_datetime": "2030-05-06 09:00", "category": "Light", "status": "pending"}
+    assert [job[2] for job in sched.conflicts("m1", "new", new)] == [early]
+    [(args, kwargs)] = queries
+    assert args == ("serviceRequests", "idx_mechanic")
+    # From the longest job length before the booking to its end
+    assert (kwargs["start"], kwargs["end"][:-1]) == ("m1|2030-05-06 06:00", "m1|2030-05-06 10:30")
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+from storage import AccountExists, AccountNotFound, SQLiteStore, increment, push_key, scan
+
+
+def test_nested_reads_and_writes(store):
+    store.set("users/u1", {"name": "A", "address": {"city": "Pretoria"}})
+    store.set("users/u1/address/code", "0002")
+    store.update("users/u1", {"phone": "1", "name": None})
+    assert store.get("users/u1") == {"address": {"city": "Pretoria", "code": "0002"}, "phone": "1"}
+    assert store.get("users/u1/address/city") == "Pretoria"
+    assert store.get("users/missing") is None
+    assert store.get_many(["users/u1/phone", "users/missing"]) == {"users/u1/phone": "1", "users/missing": None}
+
+
+def test_multi_path_update_and_increment(store):
+    store.update("", {"a/x": {"n": 1}, "b/y": True, "stats/summary/total": increment(2)})
+    store.update("", {"stats/summary/total": increment(-1), "a/x": None})
+    assert store.get("a") is None
+    assert store.get("b/y") is True
+    assert store.get("stats/summary/total") == 1
+
+
+def test_queries_use_child_order_and_ranges(store):
+    for key, status in [("k1", "b"), ("k2", "a"), ("k3", "c"), ("k4", "a")]:
+        store.set(f"serviceRequests/{key}", {"status": status})
+    assert list(store.query("serviceRequests", "status", equal="a")) == ["k2", "k4"]
+    assert list(store.query("serviceRequests", "status", start="b")) == ["k1", "k3"]
+    assert list(store.query("serviceRequests", "$key", start="k2", limit=2)) == ["k2", "k3"]
+
+
+def test_scan_pages_through_everything_once(store):
+    keys = [push_key() for _ in range(23)]
+    for key in keys:
+        store.set(f"serviceRequests/{key}", {"n": 1})
+    batches = list(scan("serviceRequests", 5))
+    assert [key for batch in batches for key in batch] == sorted(keys)
+    assert all(len(batch) <= 6 for batch in batches)
+
+
+def test_push_keys_are_ordered_and_unique():
+    keys = [push_key() for _ in range(1000)]
+    assert keys == sorted(keys)
+    assert len(set(keys)) == len(keys)
+
+
+def test_claim_lets_only_one_caller_win(store):
+    winners = []
+    barrier = threading.Barrier(8)
+
+    def claim(n):
+        barrier.wait()
+        if store.claim("referenceIndex/REF-1", f"key{n}"):
+            winners.append(n)
+    threads = [threading.Thread(target=claim, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(winners) == 1
+    assert store.get("referenceIndex/REF-1") == f"key{winners[0]}"
+
+
+def test_accounts(store):
+    uid = store.create_account("Jo@Example.com", "pw")
+    assert store.find_account("jo@example.com") == uid
+    with pytest.raises(AccountExists):
+        store.create_account("jo@example.com", "pw")
+    with pytest.raises(AccountNotFound):
+        store.find_account("nobody@example.com")
+    assert list(store.list_accounts()) == [(uid, "jo@example.com")]
+
+
+def test_listen_reports_previous_versions(monkeypatch):
+    monkeypatch.setattr(SQLiteStore, "POLL_INTERVAL", 0.05)
+    store = SQLiteStore(":memory:")
+    store.set("serviceRequests/k1", {"status": "pending"})
+    seen = []
+    listener = store.listen("serviceRequests", lambda *change: seen.append(change))
+    try:
+        store.update("serviceRequests/k1", {"status": "assigned"})
+        deadline = time.monotonic() + 2
+        while not seen and time.monotonic() < deadline:
+            time.sleep(0.02)
+        store.set("serviceRequests/k1", None)
+        while len(seen) < 2 and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        listener.close()
+    assert seen == [("k1", {"status": "assigned"}, {"status": "pending"}),
+                    ("k1", None, {"status": "assigned"})]
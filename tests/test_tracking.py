@@ -0,0 +1,66 @@
+import pytest
+
+import bookings
+import tracking
+from bookings import create_booking, update_booking
+
+
+@pytest.fixture(autouse=True)
+def empty_track_cache():
+    tracking.track_cache.clear()
+
+
+def references(*values):
+    values = iter(values)
+    return lambda: next(values)
+
+
+def test_a_taken_reference_is_claimed_again(store, monkeypatch):
+    first, reference = create_booking({"status": "pending"})
+    monkeypatch.setattr(bookings, "new_reference", references(reference, "REF-ABCDEF0123"))
+    key, new_reference = create_booking({"status": "pending"})
+    assert new_reference == "REF-ABCDEF0123"
+    assert store.get(f"referenceIndex/{reference}") == first
+    assert store.get(f"referenceIndex/{new_reference}") == key
+
+
+def test_no_booking_is_written_when_every_reference_is_taken(store, monkeypatch):
+    _, reference = create_booking({"status": "pending"})
+    monkeypatch.setattr(bookings, "new_reference", lambda: reference)
+    with pytest.raises(RuntimeError):
+        create_booking({"status": "pending"})
+    assert len(store.get("serviceRequests")) == 1
+
+
+def test_a_failed_write_gives_the_reference_back(store, monkeypatch):
+    monkeypatch.setattr(bookings, "new_reference", lambda: "REF-0000000001")
+    monkeypatch.setattr(store, "update", lambda path, updates: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        create_booking({"status": "pending"})
+    assert store.get("referenceIndex/REF-0000000001") is None
+
+
+def test_lookups_are_cached_including_misses(store, monkeypatch):
+    key, reference = create_booking({"status": "pending", "category": "Light", "email": "jo@example.com"})
+    status = tracking.track(reference.lower())
+    assert status["status"] == "pending"
+    assert "email" not in status
+    assert tracking.track("REF-FFFFFFFFFF") is None
+    assert tracking.track("not a reference") is None
+    monkeypatch.setattr(store, "get", None)  # a cache miss would fail
+    assert tracking.track(reference)["status"] == "pending"
+    assert tracking.track("REF-FFFFFFFFFF") is None
+    monkeypatch.undo()
+    update_booking(key, {"status": "assigned"})
+    tracking.track_cache.clear()
+    assert tracking.track(reference)["status"] == "assigned"
+
+
+def test_tracking_page_and_api(app, store):
+    _, reference = create_booking({"status": "pending", "category": "Light"})
+    client = app.test_client()
+    response = client.get(f"/api/track/{reference}")
+    assert response.get_json()["reference_number"] == reference
+    assert "max-age" in response.headers["Cache-Control"]
+    assert client.get("/api/track/REF-FFFFFFFFFF").status_code == 404
+    assert reference in client.get(f"/track?ref={reference}").get_data(as_text=True)
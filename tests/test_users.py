@@ -0,0 +1,75 @@
+import pytest
+
+from app import HASHES
+from conftest import login
+from storage import AccountNotFound
+from users import (delete_user, email_cache, email_key, find_uid, get_mechanics, indexed_uid,
+                   reconcile_email_index, save_user_profile, user_cache)
+
+
+def test_email_key_is_a_valid_firebase_key():
+    assert email_key(" Jo.Doe@Example.COM ") == "jo%2Edoe@example%2Ecom"
+    assert email_key("a/b#c$d[e]@x.io") == "a%2Fb%23c%24d%5Be%5D@x%2Eio"
+    assert email_key(None) == ""
+
+
+def test_saved_profiles_are_found_without_auth(store):
+    uid = store.create_account("jo@example.com", "pw")
+    save_user_profile(uid, {"email": "Jo@Example.com", "role": "client"})
+    store.find_account = None  # any Auth lookup would fail
+    assert find_uid("jo@example.com") == uid
+
+
+def test_unindexed_accounts_are_looked_up_once_and_indexed(store):
+    uid = store.create_account("new@example.com", "pw")
+    assert indexed_uid("new@example.com") is None
+    assert find_uid("new@example.com") == uid
+    assert store.get(f"emailIndex/{email_key('new@example.com')}") == uid
+    with pytest.raises(AccountNotFound):
+        find_uid("nobody@example.com")
+
+
+def test_reconcile_rebuilds_the_index_from_accounts(store):
+    uid = store.create_account("a@example.com", "pw")
+    store.set("emailIndex/gone@example%2Ecom", "old-uid")
+    assert reconcile_email_index() == {
+        "a@example%2Ecom": (None, uid),
+        "gone@example%2Ecom": ("old-uid", None),
+    }
+    reconcile_email_index(write=True)
+    assert reconcile_email_index() == {}
+    assert store.get("emailIndex") == {"a@example%2Ecom": uid}
+
+
+def test_deleting_a_user_removes_the_index_entry(store):
+    uid = store.create_account("mech@example.com", "pw")
+    save_user_profile(uid, {"email": "mech@example.com", "role": "mechanic"})
+    assert get_mechanics() == {uid: {"name": None, "surname": None, "email": "mech@example.com", "phone": None}}
+    assert delete_user(uid)
+    assert store.get(f"emailIndex/{email_key('mech@example.com')}") is None
+    assert get_mechanics() == {}
+    with pytest.raises(AccountNotFound):
+        find_uid("mech@example.com")
+    # The email can be registered again and resolves to the new account
+    new_uid = store.create_account("mech@example.com", "pw")
+    assert find_uid("mech@example.com") == new_uid
+
+
+def test_login_replaces_an_entry_left_by_an_account_deleted_elsewhere(app, store):
+    old_uid = login(app.test_client(), store, "jo@example.com", "client")
+    # Deleted in the Firebase console: the index still names the old uid
+    store.delete_account(old_uid)
+    store.set(f"users/{old_uid}", None)
+    user_cache.clear()
+    client = app.test_client()
+    response = client.post("/login", data={"email": "jo@example.com", "password": "Passw0rd!"})
+    assert "Login failed" in client.get(response.headers["Location"]).get_data(as_text=True)
+    assert indexed_uid("jo@example.com") is None
+    # Registered again with a new account and profile
+    new_uid = store.create_account("jo@example.com", "pw")
+    store.set(f"users/{new_uid}", {"email": "jo@example.com", "role": "client", "name": "Jo"})
+    store.set(f"emailIndex/{email_key('jo@example.com')}", old_uid)
+    email_cache.clear()
+    response = client.post("/login", data={"email": "jo@example.com", "password": "pw"})
+    assert response.headers["Location"] == HASHES["client_dashboard"]
+    assert indexed_uid("jo@example.com") == new_uid
@@ -0,0 +1,42 @@
+# Booking status by reference number, for the public tracking page.
+# Only a few non-personal fields are shown, and results (including "not found") are
+# cached briefly so repeated checks of the same reference do not reach Firebase.
+
+import os
+from archive import lookup_reference
+from bookings import normalize_reference
+from cache import TTLCache
+from users import get_mechanics
+
+TRACK_CACHE_SIZE = int(os.getenv("TRACK_CACHE_SIZE", "4096"))
+TRACK_CACHE_TTL = int(os.getenv("TRACK_CACHE_TTL", "30"))
+
+track_cache = TTLCache(maxsize=TRACK_CACHE_SIZE, ttl=TRACK_CACHE_TTL)
+
+_NOT_FOUND = {}
+
+
+def track(reference_number):
+    """Public status of a booking as a dict, or None if there is no such reference."""
+    reference_number = normalize_reference(reference_number)
+    if not reference_number:
+        return None
+    status = track_cache.get(reference_number)
+    if status is None:
+        key, booking = lookup_reference(reference_number)
+        status = public_status(reference_number, booking) if booking else _NOT_FOUND
+        track_cache.set(reference_number, status)
+    return status or None
+
+
+def public_status(reference_number, booking):
+    mechanic = get_mechanics().get(booking.get("assigned_mechanic")) or {}
+    return {
+        "reference_number": reference_number,
+        "status": booking.get("status"),
+        "category": booking.get("category"),
+        "vehicle": booking.get("vehicle"),
+        "service_datetime": booking.get("service_datetime"),
+        "mechanic": mechanic.get("name"),
+        "archived": bool(booking.get("archived_at")),
+    }
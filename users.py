@@ -0,0 +1,206 @@
+# User profiles and the mechanic directory.
+# Profiles live under users/{uid}. Mechanics are also copied to mechanics/{uid}
+# so pages that only need mechanics never download the whole users tree, and every
+# email is indexed under emailIndex/{normalized email} = uid so login and duplicate
+# checks do not have to ask Firebase Auth.
+
+import os
+from urllib.parse import quote
+from cache import TTLCache
+from storage import AccountNotFound, get_store
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))
+MECHANIC_CACHE_TTL = int(os.getenv("MECHANIC_CACHE_TTL", "300"))
+EMAIL_CACHE_SIZE = int(os.getenv("EMAIL_CACHE_SIZE", "4096"))
+EMAIL_CACHE_TTL = int(os.getenv("EMAIL_CACHE_TTL", "3600"))
+
+# Fields copied from users/{uid} into the mechanic directory
+MECHANIC_FIELDS = ("name", "surname", "email", "phone")
+
+# Profiles of recently seen users, so load_user does not hit Firebase on every request.
+# Entries are dropped whenever the app writes to users/{uid}; changes made outside the
+# app (e.g. admin.py) become visible once the entry expires.
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+mechanic_cache = TTLCache(maxsize=1, ttl=MECHANIC_CACHE_TTL)
+# uid by emailIndex key. An email keeps its uid unless the account is deleted and
+# created again, which other workers see once their entry expires.
+email_cache = TTLCache(maxsize=EMAIL_CACHE_SIZE, ttl=EMAIL_CACHE_TTL)
+
+
+def get_user_profile(user_id):
+    user_data = user_cache.get(user_id)
+    if user_data is None:
+        user_data = get_store().get(f"users/{user_id}")
+        if user_data:
+            user_cache.set(user_id, user_data)
+    return user_data
+
+
+def get_user_profiles(user_ids):
+    """Fetch only the given users, each at most once. Returns {uid: profile}."""
+    profiles = {}
+    missing = []
+    for user_id in dict.fromkeys(filter(None, user_ids)):
+        profile = user_cache.get(user_id)
+        if profile is None:
+            missing.append(user_id)
+        else:
+            profiles[user_id] = profile
+    if missing:
+        # Uncached profiles are read together instead of one round trip each
+        fetched = get_store().get_many(f"users/{user_id}" for user_id in missing)
+        for user_id in missing:
+            profile = fetched[f"users/{user_id}"]
+            if profile:
+                user_cache.set(user_id, profile)
+                profiles[user_id] = profile
+    return profiles
+
+
+def mechanic_entry(user_data):
+    return {field: user_data.get(field) for field in MECHANIC_FIELDS}
+
+
+def email_key(email):
+    """emailIndex key of an email: trimmed, lowercased, with . and other characters
+    Firebase keys cannot hold percent-encoded."""
+    return quote((email or "").strip().lower(), safe="@+-_~").replace(".", "%2E")
+
+
+def indexed_uid(email):
+    """uid of an email according to emailIndex, or None if it is not indexed."""
+    key = email_key(email)
+    if not key:
+        return None
+    uid = email_cache.get(key)
+    if uid is None:
+        uid = get_store().get(f"emailIndex/{key}")
+        if uid:
+            email_cache.set(key, uid)
+    return uid
+
+
+def index_email(email, user_id):
+    key = email_key(email)
+    if key:
+        get_store().set(f"emailIndex/{key}", user_id)
+        email_cache.set(key, user_id)
+
+
+def refresh_uid(email):
+    """Look an email up in Firebase Auth again, replacing its emailIndex entry.
+    For entries that name an account that no longer exists. Raises AccountNotFound."""
+    key = email_key(email)
+    try:
+        uid = get_store().find_account(email)
+    except AccountNotFound:
+        if key:
+            get_store().set(f"emailIndex/{key}", None)
+            email_cache.invalidate(key)
+        raise
+    index_email(email, uid)
+    return uid
+
+
+def find_uid(email):
+    """uid of the account with this email. Only emails missing from emailIndex (accounts
+    made outside the app) reach Firebase Auth, and are indexed when found there.
+    Raises AccountNotFound."""
+    uid = indexed_uid(email)
+    if uid is None:
+        uid = get_store().find_account(email)
+        index_email(email, uid)
+    return uid
+
+
+def save_user_profile(user_id, user_data):
+    updates = {f"users/{user_id}": user_data}
+    if user_data.get("role") == "mechanic":
+        updates[f"mechanics/{user_id}"] = mechanic_entry(user_data)
+    key = email_key(user_data.get("email"))
+    if key:
+        updates[f"emailIndex/{key}"] = user_id
+    # One multi-location write keeps users/, mechanics/ and emailIndex/ in sync
+    get_store().update("", updates)
+    user_cache.invalidate(user_id)
+    if key:
+        email_cache.set(key, user_id)
+    if user_data.get("role") == "mechanic":
+        mechanic_cache.clear()
+
+
+def delete_user(user_id):
+    """Delete a user's login account and profile, with their directory and emailIndex entries."""
+    store = get_store()
+    user_data = store.get(f"users/{user_id}") or {}
+    try:
+        store.delete_account(user_id)
+    except AccountNotFound:
+        pass
+    updates = {f"users/{user_id}": None, f"mechanics/{user_id}": None}
+    key = email_key(user_data.get("email"))
+    if key and store.get(f"emailIndex/{key}") == user_id:
+        updates[f"emailIndex/{key}"] = None
+    store.update("", updates)
+    user_cache.invalidate(user_id)
+    if key:
+        email_cache.invalidate(key)
+    mechanic_cache.clear()
+    return bool(user_data)
+
+
+def reconcile_email_index(write=False):
+    """Compare emailIndex with the accounts in Firebase Auth.
+
+    Returns {key: (stored uid, account uid)} for every entry that differs; with
+    write=True the differing entries are fixed (missing accounts are removed).
+    """
+    store = get_store()
+    expected = {email_key(email): uid for uid, email in store.list_accounts() if email}
+    stored = store.get("emailIndex") or {}
+    drift = {
+        key: (stored.get(key), expected.get(key))
+        for key in set(stored) | set(expected)
+        if stored.get(key) != expected.get(key)
+    }
+    if write and drift:
+        store.update("", {f"emailIndex/{key}": uid for key, (_, uid) in drift.items()})
+        email_cache.clear()
+    return drift
+
+
+def users_by_role(role):
+    return get_store().query("users", "role", equal=role)
+
+
+def rebuild_mechanic_directory():
+    """Recreate mechanics/ from the role index on users/."""
+    users = users_by_role("mechanic")
+    mechanics = {uid: mechanic_entry(info) for uid, info in users.items()}
+    get_store().set("mechanics", mechanics)
+    mechanic_cache.clear()
+    return mechanics
+
+
+def get_mechanics():
+    """All mechanics as {uid: {name, surname, email, phone}}, cached in process."""
+    mechanics = mechanic_cache.get("all")
+    if mechanics is None:
+        mechanics = get_store().get("mechanics")
+        if mechanics is None:
+            # Directory has not been created yet on this database
+            mechanics = rebuild_mechanic_directory()
+        mechanic_cache.set("all", mechanics)
+    return mechanics
+
+
+def get_mechanic_profiles(mechanic_ids):
+    """Resolve the referenced mechanics from the directory, falling back to users/
+    (read with one get_many) for any the directory does not list."""
+    mechanics = get_mechanics()
+    found = {uid: mechanics[uid] for uid in set(filter(None, mechanic_ids)) if uid in mechanics}
+    missing = {uid for uid in mechanic_ids if uid and uid not in mechanics}
+    if missing:
+        found.update(get_user_profiles(missing))
+    return found